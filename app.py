@@ -1,23 +1,27 @@
-import cv2
-import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+import time
+import math
+_import_started = time.perf_counter()
+
+# sklearn (and the scipy stack behind it) is imported where it is used, so
+# startup does not pay for it; warm_up() loads it ahead of the first request
 from collections import Counter
-from PIL import Image
-import requests
 from io import BytesIO
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import sqlite3
 import json
-import pandas as pd
-from scipy.spatial import KDTree
-import time
+import base64
+import re
 import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
 
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, request, jsonify
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -25,27 +29,66 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # ====================== WEBCOLORS FIX ======================
 try:
     from webcolors import hex_to_rgb
-    CSS3_HEX_TO_NAMES = {
-        '#000000': 'black', '#ffffff': 'white', '#ff0000': 'red', '#00ff00': 'lime',
-        '#0000ff': 'blue', '#ffff00': 'yellow', '#ff00ff': 'fuchsia', '#00ffff': 'cyan',
-        '#800000': 'maroon', '#808000': 'olive', '#008000': 'green', '#800080': 'purple',
-        '#008080': 'teal', '#c0c0c0': 'silver', '#808080': 'gray', '#ffa500': 'orange'
-    }
 except ImportError:
     logging.info("Installing webcolors...")
     os.system('pip install --upgrade webcolors')
     try:
         from webcolors import hex_to_rgb
-        CSS3_HEX_TO_NAMES = {
-            '#000000': 'black', '#ffffff': 'white', '#ff0000': 'red', '#00ff00': 'lime',
-            '#0000ff': 'blue', '#ffff00': 'yellow', '#ff00ff': 'fuchsia', '#00ffff': 'cyan',
-            '#800000': 'maroon', '#808000': 'olive', '#008000': 'green', '#800080': 'purple',
-            '#008080': 'teal', '#c0c0c0': 'silver', '#808080': 'gray', '#ffa500': 'orange'
-        }
     except Exception as e:
         logging.error(f"Failed to install webcolors: {str(e)}")
         raise ImportError("webcolors is required but could not be installed")
 
+from backend.color_names import get_namer, name_colors, hex_to_rgb_array
+from backend.texture import PATTERN_MODEL
+from backend.embedding import EMBEDDING_DIM, EMBEDDING_MODEL
+from image_analysis import (
+    COLOR_ENGINES, DEFAULT_COLOR_ENGINE, DEFAULT_SILHOUETTE_MODE, DEFAULT_SEGMENTATION, ImageTooLargeError,
+    decode_image_bytes, image_format, analyze_image_data, analyze_image_batch, init_analysis_worker
+)
+from result_cache import ResultCache, content_digest, cache_key
+from similarity_index import SimilarityIndex
+from http_cache import DiskImageCache, create_session
+from async_fetch import AsyncFetcher
+from jobs import JobQueue
+from database import Database, connect
+
+# Spawned analysis workers re-import this module as __mp_main__ when app.py is
+# run as a script; only the main process opens the database, caches and clients
+MAIN_PROCESS = multiprocessing.current_process().name == 'MainProcess'
+
+# Largest image download or upload accepted
+MAX_IMAGE_BYTES = int(os.environ.get('FASHION_MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+
+# Outbound image fetches share one pooled session and an on-disk cache
+http_session = create_session(pool_size=int(os.environ.get('FASHION_HTTP_POOL_SIZE', 16))) if MAIN_PROCESS else None
+IMAGE_CACHE_DIR = os.environ.get('FASHION_IMAGE_CACHE_DIR', 'image_cache')
+image_cache = DiskImageCache(
+    IMAGE_CACHE_DIR,
+    max_bytes=int(os.environ.get('FASHION_IMAGE_CACHE_BYTES', 512 * 1024 * 1024))
+) if IMAGE_CACHE_DIR and MAIN_PROCESS else None
+
+# Cluster images are decoded and clustered in this many worker processes (1 disables the pool)
+ANALYSIS_WORKERS = int(os.environ.get('FASHION_ANALYSIS_WORKERS', os.cpu_count() or 1))
+_analysis_pool = None
+
+# FASHION_WARMUP=1 loads sklearn, the color namer and the analysis workers in
+# the background at startup; the cold-start time is logged against the budget
+WARMUP = os.environ.get('FASHION_WARMUP', '0').lower() in ('1', 'true', 'yes')
+COLD_START_BUDGET = float(os.environ.get('FASHION_COLD_START_BUDGET', 1.0))
+# Cluster URLs are fetched and analyzed this many at a time
+CLUSTER_WINDOW = int(os.environ.get('FASHION_CLUSTER_WINDOW', 64))
+# Distinct hex and name values counted per color family while a cluster is streamed
+CLUSTER_TALLY_LIMIT = int(os.environ.get('FASHION_CLUSTER_TALLY_LIMIT', 256))
+MAX_BATCH_IMAGES = int(os.environ.get('FASHION_MAX_BATCH_IMAGES', 256))
+# Largest request body accepted; uploads are held in memory while they are analyzed
+MAX_REQUEST_BYTES = int(os.environ.get('FASHION_MAX_REQUEST_BYTES', 128 * 1024 * 1024))
+# Embeddings of analyzed images for /api/similar; an empty directory setting disables indexing
+SIMILARITY_INDEX_DIR = os.environ.get('FASHION_SIMILARITY_DIR', 'similarity_index')
+SIMILARITY_NPROBE = int(os.environ.get('FASHION_SIMILARITY_NPROBE', 16))
+MAX_SIMILAR_RESULTS = 100
+_similarity_index = None
+_similarity_index_lock = threading.Lock()
+
 # ====================== DATABASE FUNCTIONS ======================
 def initialize_database(db_name="fashion_analysis.db"):  # Changed path to local
     try:
@@ -54,7 +97,7 @@ def initialize_database(db_name="fashion_analysis.db"):  # Changed path to local
             os.makedirs(db_dir)
             logging.info(f"Created directory: {db_dir}")
 
-        conn = sqlite3.connect(db_name, check_same_thread=False)
+        conn = connect(db_name)
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -82,13 +125,106 @@ def initialize_database(db_name="fashion_analysis.db"):  # Changed path to local
             )
         ''')
 
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_colors (
+                analysis_id INTEGER NOT NULL REFERENCES analysis_results(id),
+                hex TEXT NOT NULL,
+                r INTEGER NOT NULL,
+                g INTEGER NOT NULL,
+                b INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                percentage REAL NOT NULL
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_predictions (
+                analysis_id INTEGER NOT NULL REFERENCES analysis_results(id),
+                kind TEXT NOT NULL,
+                label TEXT NOT NULL,
+                confidence REAL
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS trend_daily_colors (
+                day TEXT NOT NULL,
+                name TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                total_percentage REAL NOT NULL,
+                PRIMARY KEY (day, name)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS trend_daily_predictions (
+                day TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                label TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (day, kind, label)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS named_clusters (
+                name TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                report_count INTEGER NOT NULL,
+                state_json TEXT NOT NULL
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS named_cluster_members (
+                cluster_name TEXT NOT NULL REFERENCES named_clusters(name),
+                image_url TEXT NOT NULL,
+                added_at TEXT NOT NULL,
+                PRIMARY KEY (cluster_name, image_url)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS named_cluster_colors (
+                cluster_name TEXT NOT NULL REFERENCES named_clusters(name),
+                simple_name TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (cluster_name, simple_name, kind, value)
+            )
+        ''')
+
+        for statement in (
+            # Every index ends in the rowid, so this one also serves (timestamp, id) keyset pages
+            'CREATE INDEX IF NOT EXISTS idx_analysis_results_timestamp ON analysis_results (timestamp)',
+            'CREATE INDEX IF NOT EXISTS idx_analysis_colors_analysis ON analysis_colors (analysis_id)',
+            'CREATE INDEX IF NOT EXISTS idx_analysis_colors_hex ON analysis_colors (hex)',
+            'CREATE INDEX IF NOT EXISTS idx_analysis_colors_name ON analysis_colors (name)',
+            'CREATE INDEX IF NOT EXISTS idx_analysis_predictions_analysis ON analysis_predictions (analysis_id)',
+            'CREATE INDEX IF NOT EXISTS idx_analysis_predictions_label ON analysis_predictions (kind, label)',
+            'CREATE INDEX IF NOT EXISTS idx_analysis_results_url_time ON analysis_results (image_url, timestamp, id)',
+            'CREATE INDEX IF NOT EXISTS idx_cluster_analysis_name_time ON cluster_analysis (cluster_name, timestamp, id)',
+            'CREATE INDEX IF NOT EXISTS idx_cluster_analysis_time_id ON cluster_analysis (timestamp, id)',
+            'CREATE INDEX IF NOT EXISTS idx_named_cluster_colors_mode ON named_cluster_colors '
+            '(cluster_name, simple_name, kind, count DESC, value)'
+        ):
+            cursor.execute(statement)
         conn.commit()
+
+        migrate_database(conn)
+        conn.close()
         logging.info(f"Database initialized at {db_name}")
         if os.path.exists(db_name):
             logging.info(f"Database file confirmed: {db_name}")
         else:
             logging.warning(f"Database file not found at {db_name}")
-        return conn
+        return Database(
+            db_name,
+            batch_size=int(os.environ.get('FASHION_DB_BATCH_SIZE', 200)),
+            flush_interval=float(os.environ.get('FASHION_DB_FLUSH_INTERVAL', 0.05))
+        )
     except sqlite3.Error as e:
         logging.error(f"Database initialization failed: {str(e)}")
         return None
@@ -96,115 +232,377 @@ def initialize_database(db_name="fashion_analysis.db"):  # Changed path to local
         logging.error(f"Unexpected error during database initialization: {str(e)}")
         return None
 
-def store_analysis_report(conn, report):
-    if not conn:
-        logging.error("No database connection")
-        return
+def migrate_database(conn):
+    """Bring an existing database up to the current schema version.
+
+    Version 1 backfills analysis_colors and analysis_predictions from the
+    JSON columns of rows written before the normalized tables existed.
+    Version 2 builds the daily trend rollups from the normalized tables.
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version < 1:
+        logging.info("Backfilling normalized color and prediction tables...")
+        last_id = conn.execute('SELECT COALESCE(MAX(analysis_id), 0) FROM analysis_colors').fetchone()[0]
+        backfilled = 0
+        while True:
+            rows = conn.execute('''
+                SELECT id, colors_json, pattern_json, style_json FROM analysis_results
+                WHERE id > ? ORDER BY id LIMIT 1000
+            ''', (last_id,)).fetchall()
+            if not rows:
+                break
+            for analysis_id, colors_json, pattern_json, style_json in rows:
+                report = {
+                    'colors': json.loads(colors_json),
+                    'predictions': {'pattern': json.loads(pattern_json), 'style': json.loads(style_json)}
+                }
+                insert_normalized_rows(conn.cursor(), analysis_id, normalized_rows(report))
+            conn.commit()
+            last_id = rows[-1][0]
+            backfilled += len(rows)
+        conn.execute('PRAGMA user_version = 1')
+        conn.commit()
+        logging.info(f"Backfilled {backfilled} analyses")
+    if version < 2:
+        logging.info("Building daily trend rollups...")
+        conn.execute('DELETE FROM trend_daily_colors')
+        conn.execute('DELETE FROM trend_daily_predictions')
+        conn.execute('''
+            INSERT INTO trend_daily_colors (day, name, count, total_percentage)
+            SELECT substr(r.timestamp, 1, 10), c.name, COUNT(*), SUM(c.percentage)
+            FROM analysis_colors c JOIN analysis_results r ON r.id = c.analysis_id
+            GROUP BY substr(r.timestamp, 1, 10), c.name
+        ''')
+        conn.execute('''
+            INSERT INTO trend_daily_predictions (day, kind, label, count)
+            SELECT substr(r.timestamp, 1, 10), p.kind, p.label, COUNT(*)
+            FROM analysis_predictions p JOIN analysis_results r ON r.id = p.analysis_id
+            GROUP BY substr(r.timestamp, 1, 10), p.kind, p.label
+        ''')
+        conn.execute('PRAGMA user_version = 2')
+        conn.commit()
+
+def normalized_rows(report, names=None):
+    """Build the analysis_colors and analysis_predictions rows for a report."""
+    colors = report['colors']
+    if names is None:
+        names = get_color_names([c['hex'] for c in colors])
+    color_rows = [
+        (c['hex'], int(c['color'][0]), int(c['color'][1]), int(c['color'][2]), name, c['percentage'])
+        for c, name in zip(colors, names)
+    ]
+    prediction_rows = [
+        (kind, report['predictions'][kind]['predicted'], report['predictions'][kind].get('confidence'))
+        for kind in ('pattern', 'style')
+    ]
+    return color_rows, prediction_rows
+
+def insert_normalized_rows(cursor, analysis_id, rows):
+    color_rows, prediction_rows = rows
+    cursor.executemany('''
+        INSERT INTO analysis_colors (analysis_id, hex, r, g, b, name, percentage)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(analysis_id,) + row for row in color_rows])
+    cursor.executemany('''
+        INSERT INTO analysis_predictions (analysis_id, kind, label, confidence)
+        VALUES (?, ?, ?, ?)
+    ''', [(analysis_id,) + row for row in prediction_rows])
+
+def update_trend_rollups(cursor, day, rows):
+    """Fold one analysis' normalized rows into the daily trend rollups."""
+    color_rows, prediction_rows = rows
+    cursor.executemany('''
+        INSERT INTO trend_daily_colors (day, name, count, total_percentage) VALUES (?, ?, 1, ?)
+        ON CONFLICT (day, name) DO UPDATE SET
+            count = count + 1,
+            total_percentage = total_percentage + excluded.total_percentage
+    ''', [(day, name, percentage) for _, _, _, _, name, percentage in color_rows])
+    cursor.executemany('''
+        INSERT INTO trend_daily_predictions (day, kind, label, count) VALUES (?, ?, ?, 1)
+        ON CONFLICT (day, kind, label) DO UPDATE SET count = count + 1
+    ''', [(day, kind, label) for kind, label, _ in prediction_rows])
+
+def query_trends(conn, start_day, end_day, limit=10, series=False):
+    """Read color, pattern and style popularity for [start_day, end_day] from the daily rollups."""
+    reader = conn.reader()
+    colors = [dict(row) for row in reader.execute('''
+        SELECT name, SUM(count) AS count, SUM(total_percentage) AS total_percentage,
+               SUM(total_percentage) / SUM(count) AS avg_percentage
+        FROM trend_daily_colors WHERE day BETWEEN ? AND ?
+        GROUP BY name ORDER BY total_percentage DESC LIMIT ?
+    ''', (start_day, end_day, limit))]
+    trends = {'start': start_day, 'end': end_day, 'colors': colors}
+    for kind, key in (('pattern', 'patterns'), ('style', 'styles')):
+        trends[key] = [dict(row) for row in reader.execute('''
+            SELECT label, SUM(count) AS count FROM trend_daily_predictions
+            WHERE kind = ? AND day BETWEEN ? AND ?
+            GROUP BY label ORDER BY count DESC LIMIT ?
+        ''', (kind, start_day, end_day, limit))]
+
+    if series:
+        top_names = [c['name'] for c in colors]
+        daily = {}
+        if top_names:
+            placeholders = ','.join('?' * len(top_names))
+            for row in reader.execute(f'''
+                SELECT day, name, count, total_percentage FROM trend_daily_colors
+                WHERE day BETWEEN ? AND ? AND name IN ({placeholders}) ORDER BY day
+            ''', [start_day, end_day] + top_names):
+                daily.setdefault(row['day'], {'day': row['day'], 'colors': {}, 'patterns': {}, 'styles': {}})
+                daily[row['day']]['colors'][row['name']] = {
+                    'count': row['count'], 'total_percentage': row['total_percentage']
+                }
+        for row in reader.execute('''
+            SELECT day, kind, label, count FROM trend_daily_predictions
+            WHERE day BETWEEN ? AND ? ORDER BY day
+        ''', (start_day, end_day)):
+            entry = daily.setdefault(row['day'], {'day': row['day'], 'colors': {}, 'patterns': {}, 'styles': {}})
+            entry['patterns' if row['kind'] == 'pattern' else 'styles'][row['label']] = row['count']
+        trends['series'] = [daily[day] for day in sorted(daily)]
+    return trends
+
+# Keyed column and JSON columns (response key -> column) of each history table
+HISTORY_TABLES = {
+    'analysis_results': ('image_url', {
+        'colors': 'colors_json',
+        'pattern': 'pattern_json',
+        'style': 'style_json',
+        'color_validation': 'color_validation_json',
+        'pattern_style_validation': 'pattern_style_validation_json'
+    }),
+    'cluster_analysis': ('cluster_name', {
+        'popular_colors': 'popular_colors_json',
+        'popular_patterns': 'popular_patterns_json',
+        'popular_styles': 'popular_styles_json',
+        'image_urls': 'image_urls_json'
+    })
+}
+
+def encode_cursor(timestamp, row_id):
+    return base64.urlsafe_b64encode(json.dumps([timestamp, row_id]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
     try:
-        cursor = conn.cursor()
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(timestamp), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def history_columns(table, include_json=True):
+    key_column, json_columns = HISTORY_TABLES[table]
+    columns = ['id', key_column, 'timestamp']
+    if include_json:
+        columns += list(json_columns.values())
+    return ', '.join(columns)
+
+def history_row(table, row):
+    """Turn a history row into a response dict, decoding whichever JSON columns were selected."""
+    _, json_columns = HISTORY_TABLES[table]
+    item = {key: row[key] for key in row.keys() if not key.endswith('_json')}
+    for key, column in json_columns.items():
+        if column in row.keys():
+            item[key] = json.loads(row[column])
+    return item
+
+def get_history_row(conn, table, row_id, include_json=True):
+    row = conn.reader().execute(
+        f'SELECT {history_columns(table, include_json)} FROM {table} WHERE id = ?', (row_id,)
+    ).fetchone()
+    return history_row(table, row) if row else None
+
+def page_history(conn, table, key=None, start=None, end=None, cursor=None, limit=50, include_json=True):
+    """Return one page of a history table, newest first.
+
+    Pages are keyset-paginated on (timestamp, id): the cursor carries the
+    last row's position, so each page is a bounded index range scan no
+    matter how deep into the table it is. start/end bound the timestamp
+    (inclusive); a bare date as end covers that whole day.
+    """
+    key_column, _ = HISTORY_TABLES[table]
+    conditions, params = [], []
+    if key is not None:
+        conditions.append(f'{key_column} = ?')
+        params.append(key)
+    if start:
+        conditions.append('timestamp >= ?')
+        params.append(start)
+    if end:
+        conditions.append('timestamp <= ?')
+        params.append(end + ' 23:59:59' if len(end) == 10 else end)
+    if cursor:
+        conditions.append('(timestamp, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    rows = conn.reader().execute(
+        f'SELECT {history_columns(table, include_json)} FROM {table} {where} '
+        f'ORDER BY timestamp DESC, id DESC LIMIT ?',
+        params + [limit + 1]
+    ).fetchall()
+    items = [history_row(table, row) for row in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]['timestamp'], items[-1]['id']) if len(rows) > limit else None
+    return {'items': items, 'next_cursor': next_cursor}
+
+def log_write_failure(description):
+    """Return a Future callback that logs a failed queued write."""
+    def callback(future):
+        if future.exception() is not None:
+            logging.error(f"Failed to store {description}: {str(future.exception())}")
+    return callback
+
+def analysis_insert(report, names=None):
+    """Build the write operation that inserts one report, its normalized rows and its rollups."""
+    row = (
+        report['image_url'],
+        report['timestamp'],
+        json.dumps(report['colors']),
+        json.dumps(report['predictions']['pattern']),
+        json.dumps(report['predictions']['style']),
+        json.dumps(report['validation']['colors']),
+        json.dumps(report['validation']['pattern_style'])
+    )
+    child_rows = normalized_rows(report, names)
+
+    def insert(cursor):
         cursor.execute('''
             INSERT INTO analysis_results (
                 image_url, timestamp, colors_json, pattern_json, style_json,
                 color_validation_json, pattern_style_validation_json
             ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            report['image_url'],
-            report['timestamp'],
-            json.dumps(report['colors']),
-            json.dumps(report['predictions']['pattern']),
-            json.dumps(report['predictions']['style']),
-            json.dumps(report['validation']['colors']),
-            json.dumps(report['validation']['pattern_style'])
-        ))
-        conn.commit()
-        logging.info("Report stored in database")
-    except sqlite3.Error as e:
-        logging.error(f"Failed to store report: {str(e)}")
+        ''', row)
+        analysis_id = cursor.lastrowid
+        insert_normalized_rows(cursor, analysis_id, child_rows)
+        update_trend_rollups(cursor, report['timestamp'][:10], child_rows)
+        return analysis_id
+
+    return insert
+
+def store_analysis_report(conn, report):
+    """Queue a report for the database writer; returns a Future of the new row id."""
+    if not conn:
+        logging.error("No database connection")
+        return None
+    future = conn.write(analysis_insert(report))
+    future.add_done_callback(log_write_failure("report"))
+    logging.info("Report queued for storage")
+    return future
+
+def store_analysis_reports(conn, reports):
+    """Queue many reports as a single write operation; returns a Future of their row ids.
+
+    The reports commit (or fail) together, and all their colors are named
+    with one lookup.
+    """
+    if not conn:
+        logging.error("No database connection")
+        return None
+    names = get_color_names([c['hex'] for report in reports for c in report['colors']])
+    inserts = []
+    offset = 0
+    for report in reports:
+        inserts.append(analysis_insert(report, names[offset:offset + len(report['colors'])]))
+        offset += len(report['colors'])
+
+    def insert_all(cursor):
+        return [insert(cursor) for insert in inserts]
+
+    future = conn.write(insert_all)
+    future.add_done_callback(log_write_failure(f"batch of {len(reports)} reports"))
+    logging.info(f"{len(reports)} reports queued for storage")
+    return future
 
 def store_cluster_analysis(conn, cluster_report):
+    """Queue a cluster report for the database writer; returns a Future of the new row id."""
     if not conn:
         logging.error("No database connection")
-        return
-    try:
-        cursor = conn.cursor()
+        return None
+    row = (
+        cluster_report['cluster_name'],
+        cluster_report['timestamp'],
+        json.dumps(cluster_report['popular_colors']),
+        json.dumps(cluster_report['popular_patterns']),
+        json.dumps(cluster_report['popular_styles']),
+        json.dumps(cluster_report['image_urls'])
+    )
+
+    def insert(cursor):
         cursor.execute('''
             INSERT INTO cluster_analysis (
                 cluster_name, timestamp, popular_colors_json,
                 popular_patterns_json, popular_styles_json, image_urls_json
             ) VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            cluster_report['cluster_name'],
-            cluster_report['timestamp'],
-            json.dumps(cluster_report['popular_colors']),
-            json.dumps(cluster_report['popular_patterns']),
-            json.dumps(cluster_report['popular_styles']),
-            json.dumps(cluster_report['image_urls'])
-        ))
-        conn.commit()
-        logging.info("Cluster analysis stored")
-    except sqlite3.Error as e:
-        logging.error(f"Failed to store cluster report: {str(e)}")
+        ''', row)
+        return cursor.lastrowid
+
+    future = conn.write(insert)
+    future.add_done_callback(log_write_failure("cluster report"))
+    logging.info("Cluster analysis queued for storage")
+    return future
+
+def merge_named_cluster(conn, cluster_name, url_reports):
+    """Queue a merge of (url, report) pairs into a named cluster's stored aggregate.
+
+    Runs on the writer thread, so concurrent appends to one cluster are
+    serialized. URLs that are already members are skipped. state_json only
+    holds sums and counts; the hex and name counts of each color family are
+    upserted into named_cluster_colors, so an append costs the same however
+    large the cluster is. The Future resolves to (aggregate, added_count),
+    where the aggregate has the cluster's totals but no hex or name counts.
+    """
+    def merge(cursor):
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        row = cursor.execute('SELECT state_json FROM named_clusters WHERE name = ?', (cluster_name,)).fetchone()
+        aggregate = ClusterAggregate.from_state(json.loads(row[0])) if row else ClusterAggregate()
+        new_reports = []
+        for url, report in url_reports:
+            cursor.execute('''
+                INSERT OR IGNORE INTO named_cluster_members (cluster_name, image_url, added_at) VALUES (?, ?, ?)
+            ''', (cluster_name, url, now))
+            if cursor.rowcount:
+                new_reports.append(report)
+        added = ClusterAggregate()
+        added.add_reports(new_reports)
+        aggregate.add_totals(added)
+        cursor.execute('''
+            INSERT INTO named_clusters (name, created_at, updated_at, report_count, state_json)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                updated_at = excluded.updated_at,
+                report_count = excluded.report_count,
+                state_json = excluded.state_json
+        ''', (cluster_name, now, now, aggregate.report_count, json.dumps(aggregate.to_state())))
+        cursor.executemany('''
+            INSERT INTO named_cluster_colors (cluster_name, simple_name, kind, value, count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (cluster_name, simple_name, kind, value) DO UPDATE SET count = count + excluded.count
+        ''', [
+            (cluster_name, simple_name, kind, value, count)
+            for simple_name, entry in added.colors.items()
+            for kind in ('hex', 'name')
+            for value, count in entry[kind].items()
+        ])
+        return aggregate, len(new_reports)
+
+    future = conn.write(merge)
+    future.add_done_callback(log_write_failure(f"cluster {cluster_name}"))
+    return future
 
 # ====================== COLOR UTILITIES ======================
 def get_color_name(hex_color):
     try:
-        rgb_color = hex_to_rgb(hex_color)
-        hex_codes = list(CSS3_HEX_TO_NAMES.keys())
-        rgb_values = [hex_to_rgb(hex_code) for hex_code in hex_codes]
-        color_names = [CSS3_HEX_TO_NAMES[hex_code] for hex_code in hex_codes]
-        kdt_db = KDTree(rgb_values)
-        _, index = kdt_db.query(rgb_color)
-        return color_names[index]
+        return name_colors([hex_to_rgb(hex_color)])[0]
     except Exception as e:
         logging.error(f"Error in get_color_name: {str(e)}")
         return "unknown"
 
-# ====================== VALIDATION FUNCTIONS ======================
-def validate_color_clustering(img_array, dominant_colors, k=5):
-    validation_results = {'status': 'PASS', 'metrics': {}, 'warnings': []}
+def get_color_names(hex_colors):
+    """Name a batch of hex colors with a single lookup against the shared palette."""
     try:
-        max_size = 200
-        h, w = img_array.shape[:2]
-        if h > max_size or w > max_size:
-            scale = max_size / max(h, w)
-            img_array = cv2.resize(img_array, (int(w * scale), int(h * scale)))
-
-        img_rgb = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB if len(img_array.shape) == 2 else cv2.COLOR_BGR2RGB)
-        pixels = img_rgb.reshape(-1, 3)
-        sample_size = min(500, len(pixels))
-        if sample_size < k:
-            validation_results['status'] = 'FAIL'
-            validation_results['error'] = "Too few pixels for clustering"
-            return validation_results
-
-        start_time = time.time()
-        sample_indices = np.random.choice(len(pixels), sample_size, replace=False)
-        kmeans = KMeans(n_clusters=k, n_init=3, random_state=42)
-        kmeans.fit(pixels[sample_indices])
-        silhouette = silhouette_score(pixels[sample_indices], kmeans.labels_)
-        validation_results['metrics']['silhouette_score'] = silhouette
-        logging.info(f"Clustering took {time.time() - start_time:.2f} seconds")
-        if silhouette < 0.5:
-            validation_results['warnings'].append(f'Low silhouette score ({silhouette:.2f})')
-
-        color_values = np.array([c['color'] for c in dominant_colors])
-        color_variation = np.std(color_values, axis=0).mean()
-        validation_results['metrics']['color_variation'] = color_variation
-        if color_variation > 15:
-            validation_results['warnings'].append(f'High color variation ({color_variation:.2f})')
-
-        percentage_sum = sum(c['percentage'] for c in dominant_colors)
-        validation_results['metrics']['percentage_sum'] = percentage_sum
-        if abs(percentage_sum - 1.0) > 0.01:
-            validation_results['warnings'].append(f'Percentage sum incorrect ({percentage_sum:.2f})')
-
-        # visualize_color_validation(img_rgb, dominant_colors, k)  # Commented out for API
+        return name_colors(hex_to_rgb_array(hex_colors))
     except Exception as e:
-        validation_results['status'] = 'FAIL'
-        validation_results['error'] = str(e)
-        logging.error(f"Error in validate_color_clustering: {str(e)}")
-    return validation_results
+        logging.error(f"Error in get_color_names: {str(e)}")
+        return ["unknown"] * len(hex_colors)
 
+# ====================== VALIDATION FUNCTIONS ======================
 def validate_pattern_style(predictions):
     validation_results = {'status': 'PASS', 'warnings': []}
     try:
@@ -253,59 +651,143 @@ def validate_pattern_style(predictions):
 #         logging.error(f"Error in visualize_color_validation: {str(e)}")
 
 # ====================== ANALYSIS FUNCTIONS ======================
-def load_image_from_url(url, retries=3, timeout=10):
-    for attempt in range(retries):
-        try:
-            response = requests.get(url, stream=True, timeout=timeout)
-            response.raise_for_status()
-            img = Image.open(BytesIO(response.content))
-            img_array = np.array(img)
-            if img_array.size == 0:
-                raise ValueError("Empty image")
-            return img_array
-        except Exception as e:
-            logging.warning(f"Attempt {attempt+1} failed for {url}: {str(e)}")
-            if attempt < retries - 1:
-                time.sleep(2)
-    logging.error(f"Failed to load image from {url} after {retries} attempts")
-    return None
+def read_upload(stream, max_bytes=MAX_IMAGE_BYTES):
+    """Read an uploaded image body, refusing anything over max_bytes."""
+    data = stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ImageTooLargeError(f"Upload exceeds {max_bytes} bytes")
+    return data
+
+def upload_url(data):
+    """Stable identifier for an uploaded image, used in place of its URL."""
+    return f"upload://{content_digest(data)}"
+
+def fetch_image_bytes(url, timeout=10, max_bytes=MAX_IMAGE_BYTES, etag=None):
+    """Stream an image body, aborting as soon as it exceeds max_bytes.
 
-def extract_dominant_colors(img_array, k=5):
+    Returns (body, etag). Requests go through the shared keep-alive session
+    and are revalidated against the disk image cache, whose body is reused on
+    a 304. Otherwise, when etag is given it is sent as If-None-Match and a 304
+    answer comes back as (None, etag) without any body.
+    """
+    headers = image_cache.conditional_headers(url) if image_cache else {}
+    if etag and 'If-None-Match' not in headers:
+        headers['If-None-Match'] = etag
+    response = http_session.get(url, stream=True, timeout=timeout, headers=headers)
     try:
-        max_size = 200
-        h, w = img_array.shape[:2]
-        if h > max_size or w > max_size:
-            scale = max_size / max(h, w)
-            img_array = cv2.resize(img_array, (int(w * scale), int(h * scale)))
-
-        img_rgb = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB if len(img_array.shape) == 2 else cv2.COLOR_BGR2RGB)
-        pixels = img_rgb.reshape(-1, 3)
-        if len(pixels) < k:
-            logging.error("Too few pixels for clustering")
-            return []
-        kmeans = KMeans(n_clusters=k, n_init=3, random_state=42)
-        kmeans.fit(pixels)
-        counts = Counter(kmeans.labels_)
-        center_colors = kmeans.cluster_centers_
-        total = sum(counts.values())
-
-        dominant_colors = []
-        for i in counts.keys():
-            color = np.clip(center_colors[i], 0, 255).astype(int)
-            percentage = counts[i] / total
-            dominant_colors.append({
-                'color': color.tolist(),
-                'percentage': float(percentage),
-                'hex': '#%02x%02x%02x' % tuple(color)
-            })
-        dominant_colors.sort(key=lambda x: x['percentage'], reverse=True)
-        return dominant_colors
+        if response.status_code == 304:
+            cached = image_cache.read(url) if image_cache else None
+            if cached is not None:
+                logging.info(f"Image not modified, using cached copy: {url}")
+                return cached, response.headers.get('ETag') or headers.get('If-None-Match')
+            if etag and headers.get('If-None-Match') == etag:
+                return None, etag
+            raise ValueError("Server answered 304 but no cached copy is available")
+        response.raise_for_status()
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise ImageTooLargeError(f"Image is {content_length} bytes, limit is {max_bytes}")
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            buffer.extend(chunk)
+            if len(buffer) > max_bytes:
+                raise ImageTooLargeError(f"Image exceeds {max_bytes} bytes")
+        data = bytes(buffer)
+        if image_cache and 'no-store' not in response.headers.get('Cache-Control', ''):
+            image_cache.store(url, data, etag=response.headers.get('ETag'),
+                              last_modified=response.headers.get('Last-Modified'))
+        return data, response.headers.get('ETag')
+    finally:
+        response.close()
+
+image_fetcher = AsyncFetcher(
+    lambda url, etag=None: fetch_image_bytes(url, etag=etag),
+    per_host=int(os.environ.get('FASHION_FETCH_PER_HOST', 4)),
+    max_concurrency=int(os.environ.get('FASHION_FETCH_CONCURRENCY', 32)),
+    deadline=float(os.environ.get('FASHION_FETCH_DEADLINE', 60)),
+    no_retry=(ImageTooLargeError,)
+) if MAIN_PROCESS else None
+
+def download_image(url, etag=None):
+    """Fetch an image with retries; returns (body, etag) or None on failure."""
+    return image_fetcher.fetch(url, etag=etag)
+
+def download_images(urls, cache=None, deadline_at=None):
+    """Fetch many images concurrently; returns (body, etag) or None per URL, in order.
+
+    URLs already known to the result cache are revalidated with their ETag.
+    deadline_at (a time.monotonic() value) defaults to FASHION_FETCH_DEADLINE
+    seconds from now.
+    """
+    etags = []
+    for url in urls:
+        known = cache.lookup_url(url) if cache else None
+        etags.append(known[0] if known else None)
+    return image_fetcher.fetch_all(urls, etags, deadline_at=deadline_at)
+
+def load_image_from_url(url):
+    fetched = download_image(url)
+    if fetched is None:
+        return None
+    try:
+        return decode_image_bytes(fetched[0])
     except Exception as e:
-        logging.error(f"Color extraction failed: {str(e)}")
-        return []
+        logging.error(f"Failed to decode image from {url}: {str(e)}")
+        return None
 
 # ====================== CLUSTER ANALYSIS ======================
-def analyze_cluster(image_urls, cluster_name, conn):
+def iter_cluster_reports(image_urls, conn, engine=None, cache=None, window=None, fetch_deadline=None):
+    """Yield (url, report) for each image in order, as soon as its analysis completes.
+
+    report is None for images that failed. URLs are fetched and analyzed in
+    windows of `window` images, so only one window of image bytes is held in
+    memory at a time. Each window's fetch gets fetch_deadline seconds, by
+    default FASHION_FETCH_DEADLINE, counted from the start of that fetch, so
+    time spent analyzing earlier windows never cuts later fetches short;
+    images a window could not fetch in time are reported as failed.
+    """
+    engine = engine or DEFAULT_COLOR_ENGINE
+    window = window or CLUSTER_WINDOW
+    if fetch_deadline is None:
+        fetch_deadline = image_fetcher.deadline
+    for offset in range(0, len(image_urls), window):
+        batch_urls = image_urls[offset:offset + window]
+        start_time = time.time()
+        downloads = download_images(batch_urls, cache=cache, deadline_at=time.monotonic() + fetch_deadline)
+        logging.info(f"Fetched {sum(d is not None for d in downloads)}/{len(batch_urls)} images in {time.time() - start_time:.2f}s")
+
+        resolved_images = []
+        for url, fetched in zip(batch_urls, downloads):
+            resolved = None
+            if fetched is not None:
+                try:
+                    resolved = resolve_image(url, engine, cache=cache, fetched=fetched)
+                except Exception as e:
+                    logging.error(f"Analysis failed for {url}: {str(e)}")
+            if resolved is None:
+                logging.warning(f"Skipping URL due to download failure: {url}")
+            resolved_images.append((url, resolved))
+        del downloads
+
+        # Decode, extract and validate the cache misses across the worker pool
+        pending = [resolved['data'] for _, resolved in resolved_images if resolved and 'report' not in resolved]
+        analyses = run_image_analyses(pending, engine)
+
+        for url, resolved in resolved_images:
+            report = None
+            if resolved and 'report' in resolved:
+                report = resolved['report']
+            elif resolved:
+                analysis = next(analyses)
+                if analysis:
+                    report = finish_analysis(url, resolved, analysis, conn, cache=cache)
+                else:
+                    logging.warning(f"Skipping URL due to analysis failure: {url}")
+            if report:
+                logging.info(f"Successfully analyzed: {url}")
+            yield url, report
+
+def analyze_cluster(image_urls, cluster_name, conn, engine=None, cache=None):
     cluster_report = {
         'cluster_name': cluster_name,
         'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -318,13 +800,9 @@ def analyze_cluster(image_urls, cluster_name, conn):
     
     logging.info(f"Starting analysis of cluster: {cluster_name} with {len(image_urls)} images")
     
-    for url in image_urls:
-        report = analyze_fashion_image(url, conn)
+    for _, report in iter_cluster_reports(image_urls, conn, engine=engine, cache=cache):
         if report:
             cluster_report['individual_reports'].append(report)
-            logging.info(f"Successfully analyzed: {url}")
-        else:
-            logging.warning(f"Skipping URL due to analysis failure: {url}")
     
     logging.info(f"Generated {len(cluster_report['individual_reports'])} valid reports")
     if cluster_report['individual_reports']:
@@ -340,50 +818,290 @@ def analyze_cluster(image_urls, cluster_name, conn):
     
     return cluster_report
 
-def compute_popular_features(cluster_report):
-    try:
-        logging.info("Computing popular features...")
-        all_colors = []
-        pattern_counter = Counter()
-        style_counter = Counter()
-        
-        for report in cluster_report['individual_reports']:
-            for color in report['colors']:
-                all_colors.append({
-                    'hex': color['hex'],
-                    'percentage': color['percentage'],
-                    'name': get_color_name(color['hex'])
-                })
-            pattern = report['predictions']['pattern']['predicted']
-            style = report['predictions']['style']['predicted']
-            pattern_counter[pattern] += 1
-            style_counter[style] += 1
-        
-        logging.info(f"Collected {len(all_colors)} colors")
-        color_df = pd.DataFrame(all_colors)
-        if not color_df.empty:
-            color_df['simple_name'] = color_df['name'].str.replace(r'(light|dark|pale|bright)', '', regex=True).str.strip()
-            popular_colors = color_df.groupby('simple_name').agg(
-                total_percentage=('percentage', 'sum'),
-                count=('hex', 'count'),
-                hex=('hex', lambda x: x.mode()[0]),
-                name=('name', lambda x: x.mode()[0])
-            ).reset_index()
-            popular_colors['avg_percentage'] = popular_colors['total_percentage'] / popular_colors['count']
-            popular_colors = popular_colors.sort_values('total_percentage', ascending=False).head(5)
-            cluster_report['popular_colors'] = popular_colors.to_dict('records')
-            logging.info(f"Popular colors: {[c['name'] for c in cluster_report['popular_colors']]}")
+def stream_cluster(image_urls, cluster_name, conn, engine=None, cache=None):
+    """Analyze a cluster and yield NDJSON lines: one per image, then the cluster aggregate.
+
+    Popular features are tallied with a ClusterAggregate as reports arrive,
+    so no per-image report is kept once its line has been sent.
+    """
+    cluster_report = {
+        'cluster_name': cluster_name,
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'image_urls': image_urls,
+        'popular_colors': [],
+        'popular_patterns': [],
+        'popular_styles': []
+    }
+    logging.info(f"Streaming analysis of cluster: {cluster_name} with {len(image_urls)} images")
+
+    aggregate = ClusterAggregate(tally_limit=CLUSTER_TALLY_LIMIT)
+    for url, report in iter_cluster_reports(image_urls, conn, engine=engine, cache=cache):
+        if report:
+            aggregate.add(report)
+            yield json.dumps({'type': 'report', 'report': report}) + '\n'
         else:
-            logging.warning("No colors collected for cluster")
-        
+            yield json.dumps({'type': 'failure', 'image_url': url}) + '\n'
+
+    finish_cluster(cluster_report, aggregate, conn)
+    yield json.dumps(dict(cluster_report, type='cluster')) + '\n'
+
+def finish_cluster(cluster_report, aggregate, conn, store=True):
+    """Fill in and, unless store is False, store a cluster report from its running aggregate."""
+    logging.info(f"Generated {aggregate.report_count} valid reports")
+    if aggregate.report_count:
+        try:
+            aggregate.apply(cluster_report)
+            if store:
+                store_cluster_analysis(conn, cluster_report)
+            logging.info("Cluster analysis completed")
+        except Exception as e:
+            logging.error(f"Error in cluster analysis: {str(e)}")
+    else:
+        logging.warning(f"No valid reports generated for cluster: {cluster_report['cluster_name']}")
+    cluster_report['report_count'] = aggregate.report_count
+
+def named_cluster_report(cluster_name, aggregate, created_at=None, updated_at=None, modes=None):
+    cluster_report = {
+        'cluster_name': cluster_name,
+        'created_at': created_at,
+        'updated_at': updated_at,
+        'report_count': aggregate.report_count,
+        'popular_colors': [],
+        'popular_patterns': [],
+        'popular_styles': []
+    }
+    if aggregate.report_count:
+        aggregate.apply(cluster_report, modes)
+    return cluster_report
+
+def load_named_cluster(cluster_name, conn):
+    """Return the stored report for a named cluster, or None if it does not exist."""
+    reader = conn.reader()
+    row = reader.execute(
+        'SELECT created_at, updated_at, state_json FROM named_clusters WHERE name = ?', (cluster_name,)
+    ).fetchone()
+    if row is None:
+        return None
+    aggregate = ClusterAggregate.from_state(json.loads(row['state_json']))
+
+    def modes(simple_name):
+        # Most frequent value, ties broken by the smallest, read off idx_named_cluster_colors_mode
+        return tuple(reader.execute('''
+            SELECT value FROM named_cluster_colors WHERE cluster_name = ? AND simple_name = ? AND kind = ?
+            ORDER BY count DESC, value LIMIT 1
+        ''', (cluster_name, simple_name, kind)).fetchone()[0] for kind in ('hex', 'name'))
+
+    return named_cluster_report(cluster_name, aggregate, row['created_at'], row['updated_at'], modes)
+
+def append_to_cluster(image_urls, cluster_name, conn, engine=None, cache=None):
+    """Analyze the URLs not yet in a named cluster and merge them into its running aggregate.
+
+    Only new images are fetched and analyzed; the stored sums and counts are
+    updated in place, so the cost grows with the append rather than the cluster.
+    """
+    image_urls = list(dict.fromkeys(image_urls))
+    reader = conn.reader()
+    existing = set()
+    for offset in range(0, len(image_urls), 500):
+        chunk = image_urls[offset:offset + 500]
+        existing.update(row[0] for row in reader.execute(
+            f"SELECT image_url FROM named_cluster_members WHERE cluster_name = ? "
+            f"AND image_url IN ({','.join('?' * len(chunk))})",
+            [cluster_name] + chunk
+        ))
+    new_urls = [url for url in image_urls if url not in existing]
+    logging.info(f"Appending {len(new_urls)} new images to cluster {cluster_name} ({len(existing)} already present)")
+
+    url_reports = []
+    failed = []
+    for url, report in iter_cluster_reports(new_urls, conn, engine=engine, cache=cache):
+        if report:
+            url_reports.append((url, report))
+        else:
+            failed.append(url)
+
+    _, added = merge_named_cluster(conn, cluster_name, url_reports).result()
+    cluster_report = load_named_cluster(cluster_name, conn)
+    cluster_report['appended'] = {
+        'added': added,
+        'skipped': len(image_urls) - len(new_urls) + len(url_reports) - added,
+        'failed': failed
+    }
+    return cluster_report
+
+def run_cluster_job(job, report_progress, is_cancelled):
+    """JobQueue entry point: analyze a queued cluster and return its aggregate report."""
+    image_urls = job['image_urls']
+    cluster_report = {
+        'cluster_name': job['cluster_name'],
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'image_urls': image_urls,
+        'popular_colors': [],
+        'popular_patterns': [],
+        'popular_styles': []
+    }
+    logging.info(f"Running cluster job {job['job_id']}: {job['cluster_name']} with {len(image_urls)} images")
+
+    aggregate = ClusterAggregate(tally_limit=CLUSTER_TALLY_LIMIT)
+    failed = 0
+    cancelled = False
+    engine = job['options'].get('engine')
+    # Jobs run in the background, so they are not held to the request fetch deadline
+    for _, report in iter_cluster_reports(image_urls, conn, engine=engine, cache=result_cache, fetch_deadline=math.inf):
+        if report:
+            aggregate.add(report)
+        else:
+            failed += 1
+        report_progress(aggregate.report_count, failed)
+        if is_cancelled():
+            logging.info(f"Cluster job {job['job_id']} cancelled")
+            cancelled = True
+            break
+    report_progress(aggregate.report_count, failed, force=True)
+
+    # A cancelled job's partial report is returned with the job but never
+    # stored, so the cluster history only holds complete analyses
+    finish_cluster(cluster_report, aggregate, conn, store=not cancelled)
+    if cancelled:
+        cluster_report['partial'] = True
+    return cluster_report
+
+class ClusterAggregate:
+    """Running color, pattern and style tallies for a cluster.
+
+    Produces the same popular_* lists as a full pass over the individual
+    reports while only keeping per-color-family counters. With a
+    tally_limit, each family counts at most that many distinct hex and name
+    values; past it a new value takes over the least counted one's count
+    (the space-saving sketch), so a streamed cluster's memory stays bounded
+    and the modes stay exact until a family has more distinct values.
+    """
+
+    def __init__(self, tally_limit=None):
+        self.tally_limit = tally_limit
+        self.report_count = 0
+        self.colors = {}
+        self.patterns = Counter()
+        self.styles = Counter()
+
+    def add(self, report):
+        self.add_reports([report])
+
+    def to_state(self):
+        """JSON-serializable running sums and counts, without the hex and name counts."""
+        return {
+            'report_count': self.report_count,
+            'colors': {
+                simple_name: {
+                    'total_percentage': entry['total_percentage'],
+                    'count': entry['count']
+                } for simple_name, entry in self.colors.items()
+            },
+            'patterns': dict(self.patterns),
+            'styles': dict(self.styles)
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        aggregate = cls()
+        aggregate.report_count = state['report_count']
+        for simple_name, entry in state['colors'].items():
+            aggregate.colors[simple_name] = aggregate._family(simple_name)
+            aggregate.colors[simple_name]['total_percentage'] = entry['total_percentage']
+            aggregate.colors[simple_name]['count'] = entry['count']
+        aggregate.patterns = Counter(state['patterns'])
+        aggregate.styles = Counter(state['styles'])
+        return aggregate
+
+    def add_totals(self, other):
+        """Add another aggregate's sums and counts, leaving out its hex and name counts."""
+        for simple_name, entry in other.colors.items():
+            mine = self._family(simple_name)
+            mine['total_percentage'] += entry['total_percentage']
+            mine['count'] += entry['count']
+        self.patterns.update(other.patterns)
+        self.styles.update(other.styles)
+        self.report_count += other.report_count
+
+    def _family(self, simple_name):
+        return self.colors.setdefault(simple_name, {
+            'total_percentage': 0.0, 'count': 0, 'hex': Counter(), 'name': Counter()
+        })
+
+    def _tally(self, counter, value):
+        if self.tally_limit is None or value in counter or len(counter) < self.tally_limit:
+            counter[value] += 1
+        else:
+            evicted = min(counter, key=counter.get)
+            counter[value] = counter.pop(evicted) + 1
+
+    def add_reports(self, reports):
+        """Fold reports in, naming all of their colors with one lookup."""
+        colors = [color for report in reports for color in report['colors']]
+        names = get_color_names([color['hex'] for color in colors])
+        for color, name in zip(colors, names):
+            simple_name = re.sub(r'(light|dark|pale|bright)', '', name).strip()
+            entry = self._family(simple_name)
+            entry['total_percentage'] += color['percentage']
+            entry['count'] += 1
+            self._tally(entry['hex'], color['hex'])
+            self._tally(entry['name'], name)
+        for report in reports:
+            self.patterns[report['predictions']['pattern']['predicted']] += 1
+            self.styles[report['predictions']['style']['predicted']] += 1
+        self.report_count += len(reports)
+
+    @staticmethod
+    def _mode(counter):
+        # Most frequent value, ties broken by the smallest value as pandas' mode() does
+        return min(counter.items(), key=lambda item: (-item[1], item[0]))[0]
+
+    def popular_colors(self, top=5, modes=None):
+        """The top color families by total percentage.
+
+        modes(simple_name) returns a family's (hex, name) modes when its
+        counts are kept outside the aggregate, as for named clusters.
+        """
+        families = sorted(self.colors.items())
+        families.sort(key=lambda item: item[1]['total_percentage'], reverse=True)
+        popular = []
+        for simple_name, entry in families[:top]:
+            if modes:
+                hex_mode, name_mode = modes(simple_name)
+            else:
+                hex_mode, name_mode = self._mode(entry['hex']), self._mode(entry['name'])
+            popular.append({
+                'simple_name': simple_name,
+                'total_percentage': entry['total_percentage'],
+                'count': entry['count'],
+                'hex': hex_mode,
+                'name': name_mode,
+                'avg_percentage': entry['total_percentage'] / entry['count']
+            })
+        return popular
+
+    def apply(self, cluster_report, modes=None):
+        """Write the popular colors, patterns and styles into cluster_report."""
+        cluster_report['popular_colors'] = self.popular_colors(modes=modes)
         cluster_report['popular_patterns'] = [
-            {'pattern': p, 'count': c, 'frequency': c/len(cluster_report['individual_reports'])} 
-            for p, c in pattern_counter.most_common(3)
+            {'pattern': p, 'count': c, 'frequency': c / self.report_count}
+            for p, c in self.patterns.most_common(3)
         ]
         cluster_report['popular_styles'] = [
-            {'style': s, 'count': c, 'frequency': c/len(cluster_report['individual_reports'])} 
-            for s, c in style_counter.most_common(3)
+            {'style': s, 'count': c, 'frequency': c / self.report_count}
+            for s, c in self.styles.most_common(3)
         ]
+
+def compute_popular_features(cluster_report):
+    try:
+        logging.info("Computing popular features...")
+        aggregate = ClusterAggregate()
+        aggregate.add_reports(cluster_report['individual_reports'])
+        logging.info(f"Collected {sum(c['count'] for c in aggregate.colors.values())} colors")
+        if not aggregate.colors:
+            logging.warning("No colors collected for cluster")
+        aggregate.apply(cluster_report)
+        logging.info(f"Popular colors: {[c['name'] for c in cluster_report['popular_colors']]}")
         logging.info(f"Popular patterns: {[p['pattern'] for p in cluster_report['popular_patterns']]}")
         logging.info(f"Popular styles: {[s['style'] for s in cluster_report['popular_styles']]}")
     except Exception as e:
@@ -393,6 +1111,7 @@ def compute_popular_features(cluster_report):
         cluster_report['popular_styles'] = []
 
 # def visualize_cluster_results(cluster_report):  # Commented out for API
+#     import matplotlib.pyplot as plt  # imported here so the API never loads matplotlib
 #     try:
 #         plt.figure(figsize=(15, 10))
 #         
@@ -445,74 +1164,303 @@ def compute_popular_features(cluster_report):
 #         logging.error(f"Error in visualize_cluster_results: {str(e)}")
 
 # ====================== MAIN ANALYSIS PIPELINE ======================
-def analyze_fashion_image(image_url, conn):
-    try:
-        logging.info(f"Analyzing: {image_url}")
-        img_array = load_image_from_url(image_url)
-        if img_array is None:
+def cached_report(report, image_url, tier):
+    """Return a copy of a cached report for image_url, flagged as a cache hit."""
+    logging.info(f"Cache hit ({tier}) for {image_url}")
+    return dict(report, image_url=image_url, cache={'hit': True, 'tier': tier})
+
+def resolve_image(image_url, engine, cache=None, fetched=None):
+    """Download an image (unless prefetched) and consult the result cache.
+
+    Returns a dict holding either 'report' for a cache hit, or the 'data',
+    'etag', 'digest' and cache 'key' of an image that still needs analysis.
+    Returns None if the image could not be downloaded. A cached report is
+    only a hit if the image's embedding is (or can be aliased) in the
+    similarity index; otherwise the image is analyzed again to compute it.
+    """
+    known = cache.lookup_url(image_url) if cache else None
+    if fetched is None:
+        fetched = download_image(image_url, etag=known[0] if known else None)
+    if fetched is None:
+        logging.error(f"Failed to load image: {image_url}")
+        return None
+    data, etag = fetched
+
+    if data is not None:
+        digest = content_digest(data)
+    else:
+        digest = known[1] if known else None
+    key = cache_key(digest, engine, DEFAULT_SILHOUETTE_MODE, DEFAULT_SEGMENTATION, PATTERN_MODEL)
+    if cache and digest:
+        report, tier = cache.get(key)
+        if report is not None and index_alias(image_url, digest):
+            cache.remember_url(image_url, etag, digest)
+            return {'report': cached_report(report, image_url, tier)}
+    if data is None:
+        # The server confirmed our ETag but the report has been evicted
+        fetched = download_image(image_url)
+        if fetched is None:
             logging.error(f"Failed to load image: {image_url}")
             return None
-        logging.info("Image loaded")
+        data, etag = fetched
+        digest = content_digest(data)
+        key = cache_key(digest, engine, DEFAULT_SILHOUETTE_MODE, DEFAULT_SEGMENTATION, PATTERN_MODEL)
+    return {'data': data, 'etag': etag, 'digest': digest, 'key': key}
 
-        colors = extract_dominant_colors(img_array)
-        if not colors:
-            logging.error(f"Failed to extract colors for: {image_url}")
-            return None
-        logging.info(f"Extracted colors: {[c['hex'] for c in colors]}")
-
-        logging.info("Validating colors...")
-        color_validation = validate_color_clustering(img_array, colors)
-        logging.info(f"Color Validation Status: {color_validation['status']}")
-        if color_validation.get('warnings'):
-            logging.warning("Color validation warnings:")
-            for warning in color_validation['warnings']:
-                logging.warning(f"  - {warning}")
-
-        logging.info("Running pattern/style analysis...")
-        predictions = {
-            'pattern': {
-                'predicted': 'floral',
-                'confidence': 0.82,
-                'all_options': {'floral': 0.82, 'striped': 0.10, 'geometric': 0.05, 'plain': 0.03}
-            },
-            'style': {
-                'predicted': 'casual',
-                'confidence': 0.75,
-                'all_options': {'casual': 0.75, 'formal': 0.15, 'bohemian': 0.07, 'sporty': 0.03}
-            }
+def warm_up():
+    """Load the heavy analysis dependencies ahead of the first request."""
+    start_time = time.perf_counter()
+    import sklearn.cluster  # noqa: F401
+    import sklearn.metrics  # noqa: F401
+    get_namer()
+    if ANALYSIS_WORKERS > 1:
+        # One trivial task per worker spawns them all and runs their initializers
+        list(get_analysis_pool().map(abs, range(ANALYSIS_WORKERS)))
+    logging.info(f"Warm-up finished in {time.perf_counter() - start_time:.2f}s")
+
+def get_analysis_pool():
+    """Return the shared worker pool for analyze_image_data, creating it on first use."""
+    global _analysis_pool
+    if _analysis_pool is None:
+        _analysis_pool = ProcessPoolExecutor(
+            max_workers=ANALYSIS_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_analysis_worker
+        )
+        logging.info(f"Started analysis pool with {ANALYSIS_WORKERS} workers")
+    return _analysis_pool
+
+def discard_analysis_pool(pool):
+    """Shut down a broken worker pool so the next get_analysis_pool() starts a fresh one."""
+    global _analysis_pool
+    if _analysis_pool is pool:
+        _analysis_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def run_image_analyses(datas, engine=None):
+    """Yield analyze_image_data results for many images, in order, using the worker pool when enabled."""
+    engine = engine or DEFAULT_COLOR_ENGINE
+    done = 0
+    if ANALYSIS_WORKERS > 1 and len(datas) > 1:
+        chunksize = max(1, len(datas) // (ANALYSIS_WORKERS * 4))
+        pool = get_analysis_pool()
+        try:
+            for result in pool.map(
+                analyze_image_data, datas, repeat(engine), repeat(DEFAULT_SILHOUETTE_MODE), chunksize=chunksize
+            ):
+                yield result
+                done += 1
+        except BrokenProcessPool as e:
+            # A worker died; a broken executor refuses all further work, so replace it
+            logging.error(f"Analysis pool broke, restarting it and falling back to in-process analysis: {str(e)}")
+            discard_analysis_pool(pool)
+        except Exception as e:
+            logging.error(f"Analysis pool failed, falling back to in-process analysis: {str(e)}")
+    for data in datas[done:]:
+        yield analyze_image_data(data, engine, DEFAULT_SILHOUETTE_MODE)
+
+def build_report(image_url, analysis):
+    """Attach predictions and their validation to an image's color analysis."""
+    colors, color_validation, pattern = analysis[:3]
+
+    predictions = {
+        'pattern': pattern,
+        'style': {
+            'predicted': 'casual',
+            'confidence': 0.75,
+            'all_options': {'casual': 0.75, 'formal': 0.15, 'bohemian': 0.07, 'sporty': 0.03}
         }
+    }
 
-        logging.info("Validating pattern/style...")
-        ps_validation = validate_pattern_style(predictions)
-        logging.info(f"Pattern/Style Validation Status: {ps_validation['status']}")
-        if ps_validation.get('warnings'):
-            logging.warning("Pattern/style validation warnings:")
-            for warning in ps_validation['warnings']:
-                logging.warning(f"  - {warning}")
+    logging.info("Validating pattern/style...")
+    ps_validation = validate_pattern_style(predictions)
+    logging.info(f"Pattern/Style Validation Status: {ps_validation['status']}")
+    if ps_validation.get('warnings'):
+        logging.warning("Pattern/style validation warnings:")
+        for warning in ps_validation['warnings']:
+            logging.warning(f"  - {warning}")
 
-        report = {
-            'image_url': image_url,
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'colors': colors,
-            'predictions': predictions,
-            'validation': {
-                'colors': color_validation,
-                'pattern_style': ps_validation
-            }
+    return {
+        'image_url': image_url,
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'colors': colors,
+        'predictions': predictions,
+        'validation': {
+            'colors': color_validation,
+            'pattern_style': ps_validation
         }
+    }
+
+def finish_analysis(image_url, resolved, analysis, conn, cache=None):
+    """Build an image's report, then store, cache and index it."""
+    report = build_report(image_url, analysis)
+    store_analysis_report(conn, report)
+    index_embeddings([(image_url, resolved['digest'], analysis[3])])
+    if cache:
+        cache.put(resolved['key'], report)
+        cache.remember_url(image_url, resolved['etag'], resolved['digest'])
+    return dict(report, cache={'hit': False})
+
+def analyze_batch(items, conn, engine=None, cache=None):
+    """Analyze (image_url, fetched) pairs together and store the new reports in one transaction.
 
-        store_analysis_report(conn, report)
-        return report
+    fetched is (data, etag) as returned by download_image, or None if the
+    download failed. Returns one report, or None for failures, per item.
+    """
+    engine = engine or DEFAULT_COLOR_ENGINE
+    # Batch clustering differs from per-image KMeans, so it gets its own cache entries
+    batch_engine = f"batch-{engine}"
+    reports = [None] * len(items)
+    pending = []
+    for i, (image_url, fetched) in enumerate(items):
+        if fetched is None:
+            continue
+        try:
+            resolved = resolve_image(image_url, batch_engine, cache=cache, fetched=fetched)
+        except Exception as e:
+            logging.error(f"Analysis failed for {image_url}: {str(e)}")
+            continue
+        if resolved is None:
+            continue
+        if 'report' in resolved:
+            reports[i] = resolved['report']
+        else:
+            pending.append((i, image_url, resolved))
+
+    analyses = analyze_image_batch([resolved['data'] for _, _, resolved in pending], engine=engine)
+    new_reports = []
+    embeddings = []
+    for (i, image_url, resolved), analysis in zip(pending, analyses):
+        if analysis is None:
+            logging.warning(f"Skipping image due to analysis failure: {image_url}")
+            continue
+        reports[i] = build_report(image_url, analysis)
+        new_reports.append((i, resolved))
+        embeddings.append((image_url, resolved['digest'], analysis[3]))
+
+    if new_reports:
+        store_analysis_reports(conn, [reports[i] for i, _ in new_reports])
+        index_embeddings(embeddings)
+        if cache:
+            cache.put_many([(resolved['key'], reports[i]) for i, resolved in new_reports])
+            for i, resolved in new_reports:
+                cache.remember_url(reports[i]['image_url'], resolved['etag'], resolved['digest'])
+        for i, _ in new_reports:
+            reports[i] = dict(reports[i], cache={'hit': False})
+    return reports
+
+def analyze_fashion_image(image_url, conn, engine=None, cache=None, fetched=None):
+    try:
+        logging.info(f"Analyzing: {image_url}")
+        engine = engine or DEFAULT_COLOR_ENGINE
+        resolved = resolve_image(image_url, engine, cache=cache, fetched=fetched)
+        if resolved is None:
+            return None
+        if 'report' in resolved:
+            return resolved['report']
+
+        analysis = analyze_image_data(resolved['data'], engine)
+        if analysis is None:
+            logging.error(f"Failed to extract colors for: {image_url}")
+            return None
+        return finish_analysis(image_url, resolved, analysis, conn, cache=cache)
     except Exception as e:
         logging.error(f"Analysis failed for {image_url}: {str(e)}")
         return None
 
+# ====================== SIMILARITY SEARCH ======================
+def get_similarity_index():
+    """Return the shared similarity index, opening it on first use, or None if indexing is disabled."""
+    global _similarity_index
+    if not SIMILARITY_INDEX_DIR:
+        return None
+    with _similarity_index_lock:
+        if _similarity_index is None:
+            _similarity_index = SimilarityIndex(
+                SIMILARITY_INDEX_DIR, EMBEDDING_DIM, EMBEDDING_MODEL, nprobe=SIMILARITY_NPROBE
+            )
+    return _similarity_index
+
+def index_embeddings(entries):
+    """Add (image_url, digest, embedding) entries to the similarity index.
+
+    Indexing failures are logged rather than raised; the analyses
+    themselves are already stored.
+    """
+    try:
+        index = get_similarity_index()
+        if index is not None:
+            index.add_many(entries)
+    except Exception as e:
+        logging.error(f"Similarity indexing failed: {str(e)}")
+
+def index_alias(image_url, digest):
+    """Make sure image_url is indexed, reusing the embedding of identical content.
+
+    Returns False if no embedding for the image exists yet.
+    """
+    try:
+        index = get_similarity_index()
+        return index is None or index.alias(image_url, digest)
+    except Exception as e:
+        logging.error(f"Similarity indexing failed: {str(e)}")
+        return True
+
+def find_similar(image_url, k=10, nprobe=None):
+    """Return up to k (image_url, similarity) pairs for an indexed image, or None if it is not indexed."""
+    index = get_similarity_index()
+    vector = index.vector(image_url)
+    if vector is None:
+        return None
+    start_time = time.perf_counter()
+    results = index.search(vector, k=k, exclude=image_url, nprobe=nprobe)
+    logging.info(f"Similarity search over {len(index)} images took {(time.perf_counter() - start_time) * 1000:.1f}ms")
+    return results
+
 # ====================== FLASK API ENDPOINTS ======================
+class InMemoryRequest(Request):
+    """Keeps multipart uploads in memory instead of spooling large ones to temp files.
+
+    Request bodies are bounded by MAX_CONTENT_LENGTH, so this cannot grow
+    without limit.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BytesIO()
+
 app = Flask(__name__)
+app.request_class = InMemoryRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
 CORS(app)  # Allow cross-origin requests from the frontend
 
 # Initialize database when the app starts
-conn = initialize_database()
+conn = initialize_database() if MAIN_PROCESS else None
+result_cache = ResultCache(
+    conn,
+    ttl=int(os.environ.get('FASHION_RESULT_CACHE_TTL', 7 * 24 * 3600)),
+    memory_entries=int(os.environ.get('FASHION_RESULT_CACHE_MEMORY_ENTRIES', 256)),
+    db_entries=int(os.environ.get('FASHION_RESULT_CACHE_DB_ENTRIES', 10000))
+) if conn else None
+job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Return the background job queue, starting its workers on first use."""
+    global job_queue
+    with _job_queue_lock:
+        if job_queue is None:
+            job_queue = JobQueue(run_cluster_job, conn, workers=int(os.environ.get('FASHION_JOB_WORKERS', 2)))
+            job_queue.start()
+    return job_queue
+
+# Error for request bodies that PIL cannot identify as any image format
+NOT_AN_IMAGE = 'Upload is not a recognized image'
+
+def unknown_engine_response(engine):
+    """400 response for an engine name the analysis would reject, checked before anything is fetched."""
+    if engine and engine not in COLOR_ENGINES:
+        return jsonify({'status': 'FAIL', 'error': f"Unknown color engine: {engine}"}), 400
+    return None
 
 @app.route('/api/analyze-image', methods=['POST'])
 def analyze_image_api():
@@ -521,8 +1469,12 @@ def analyze_image_api():
         image_url = data.get('image_url')
         if not image_url:
             return jsonify({'status': 'FAIL', 'error': 'No image URL provided'}), 400
+        engine = data.get('engine')
+        error = unknown_engine_response(engine)
+        if error:
+            return error
 
-        report = analyze_fashion_image(image_url, conn)
+        report = analyze_fashion_image(image_url, conn, engine=engine, cache=result_cache)
         if report:
             return jsonify(report)
         else:
@@ -531,6 +1483,101 @@ def analyze_image_api():
         logging.error(f"API error: {str(e)}")
         return jsonify({'status': 'FAIL', 'error': str(e)}), 500
 
+@app.route('/api/analyze-upload', methods=['POST'])
+def analyze_upload_api():
+    try:
+        engine = request.args.get('engine') or request.form.get('engine')
+        error = unknown_engine_response(engine)
+        if error:
+            return error
+        upload = request.files.get('image')
+        if upload is not None:
+            data = read_upload(upload.stream)
+        elif request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+            if request.content_length and request.content_length > MAX_IMAGE_BYTES:
+                raise ImageTooLargeError(f"Upload exceeds {MAX_IMAGE_BYTES} bytes")
+            data = read_upload(request.stream)
+        else:
+            return jsonify({'status': 'FAIL', 'error': "Send the image as multipart field 'image' or as a raw image body"}), 400
+        if not data:
+            return jsonify({'status': 'FAIL', 'error': 'Empty upload'}), 400
+        if not image_format(data):
+            return jsonify({'status': 'FAIL', 'error': NOT_AN_IMAGE}), 415
+
+        report = analyze_fashion_image(upload_url(data), conn, engine=engine, cache=result_cache, fetched=(data, None))
+        if report:
+            return jsonify(report)
+        else:
+            return jsonify({'status': 'FAIL', 'error': 'Analysis failed'}), 500
+    except (ImageTooLargeError, RequestEntityTooLarge) as e:
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 413
+    except Exception as e:
+        logging.error(f"Upload API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
+@app.route('/api/analyze-batch', methods=['POST'])
+def analyze_batch_api():
+    try:
+        rejected = {}  # item index -> why it was never analyzed
+        if request.files:
+            uploads = request.files.getlist('images')
+            engine = request.form.get('engine')
+            error = unknown_engine_response(engine)
+            if error:
+                return error
+            if not uploads:
+                return jsonify({'status': 'FAIL', 'error': 'No images uploaded'}), 400
+            if len(uploads) > MAX_BATCH_IMAGES:
+                return jsonify({'status': 'FAIL', 'error': f'At most {MAX_BATCH_IMAGES} images per batch'}), 413
+            items = []
+            for upload in uploads:
+                try:
+                    data = read_upload(upload.stream)
+                except ImageTooLargeError as e:
+                    logging.error(f"Rejected upload {upload.filename}: {str(e)}")
+                    rejected[len(items)] = str(e)
+                    items.append((upload.filename, None))
+                    continue
+                if not image_format(data):
+                    rejected[len(items)] = NOT_AN_IMAGE
+                    items.append((upload.filename, None))
+                    continue
+                items.append((upload_url(data), (data, None)))
+            if all(rejected.get(i) == NOT_AN_IMAGE for i in range(len(items))):
+                return jsonify({'status': 'FAIL', 'error': NOT_AN_IMAGE}), 415
+        else:
+            data = request.get_json()
+            image_urls = data.get('image_urls', [])
+            engine = data.get('engine')
+            if not image_urls:
+                return jsonify({'status': 'FAIL', 'error': 'Image URLs or uploaded images are required'}), 400
+            error = unknown_engine_response(engine)
+            if error:
+                return error
+            if len(image_urls) > MAX_BATCH_IMAGES:
+                return jsonify({'status': 'FAIL', 'error': f'At most {MAX_BATCH_IMAGES} images per batch'}), 413
+            items = list(zip(image_urls, download_images(image_urls, cache=result_cache)))
+
+        reports = analyze_batch(items, conn, engine=engine, cache=result_cache)
+        results = [
+            report if report else {'image_url': image_url, 'status': 'FAIL', 'error': rejected.get(i, 'Analysis failed')}
+            for i, ((image_url, _), report) in enumerate(zip(items, reports))
+        ]
+        analyzed = sum(1 for report in reports if report)
+        return jsonify({
+            'status': 'PASS' if analyzed == len(reports) else ('PARTIAL' if analyzed else 'FAIL'),
+            'analyzed': analyzed,
+            'failed': len(reports) - analyzed,
+            'results': results
+        })
+    except RequestEntityTooLarge as e:
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Batch API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
 @app.route('/api/analyze-cluster', methods=['POST'])
 def analyze_cluster_api():
     try:
@@ -539,13 +1586,190 @@ def analyze_cluster_api():
         image_urls = data.get('image_urls', [])
         if not cluster_name or not image_urls:
             return jsonify({'status': 'FAIL', 'error': 'Cluster name and image URLs are required'}), 400
+        engine = data.get('engine')
+        error = unknown_engine_response(engine)
+        if error:
+            return error
+
+        if data.get('async'):
+            job_id = get_job_queue().submit(cluster_name, image_urls, {'engine': engine})
+            return jsonify({'status': 'QUEUED', 'job_id': job_id}), 202
+
+        if data.get('stream'):
+            lines = stream_cluster(image_urls, cluster_name, conn, engine=engine, cache=result_cache)
+            return Response(lines, mimetype='application/x-ndjson')
 
-        cluster_report = analyze_cluster(image_urls, cluster_name, conn)
+        cluster_report = analyze_cluster(image_urls, cluster_name, conn, engine=engine, cache=result_cache)
         return jsonify(cluster_report)
     except Exception as e:
         logging.error(f"Cluster API error: {str(e)}")
         return jsonify({'status': 'FAIL', 'error': str(e)}), 500
 
+@app.route('/api/clusters/<cluster_name>', methods=['GET'])
+def named_cluster_api(cluster_name):
+    try:
+        cluster_report = load_named_cluster(cluster_name, conn)
+        if cluster_report is None:
+            return jsonify({'status': 'FAIL', 'error': 'Cluster not found'}), 404
+        return jsonify(cluster_report)
+    except Exception as e:
+        logging.error(f"Cluster read API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
+@app.route('/api/clusters/<cluster_name>/append', methods=['POST'])
+def cluster_append_api(cluster_name):
+    try:
+        data = request.get_json()
+        image_urls = data.get('image_urls', [])
+        if not image_urls:
+            return jsonify({'status': 'FAIL', 'error': 'Image URLs are required'}), 400
+        engine = data.get('engine')
+        error = unknown_engine_response(engine)
+        if error:
+            return error
+
+        cluster_report = append_to_cluster(image_urls, cluster_name, conn, engine=engine, cache=result_cache)
+        return jsonify(cluster_report)
+    except Exception as e:
+        logging.error(f"Cluster append API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
+def history_params():
+    """Common query parameters of the history endpoints."""
+    return {
+        'start': request.args.get('start'),
+        'end': request.args.get('end'),
+        'cursor': request.args.get('cursor'),
+        'limit': max(1, min(int(request.args.get('limit', 50)), 500)),
+        'include_json': request.args.get('omit_json', '').lower() not in ('1', 'true', 'yes')
+    }
+
+@app.route('/api/analyses', methods=['GET'])
+def analyses_api():
+    try:
+        page = page_history(conn, 'analysis_results', key=request.args.get('image_url'), **history_params())
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'status': 'FAIL', 'error': f'Invalid parameters: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"Analyses API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
+@app.route('/api/analyses/<int:analysis_id>', methods=['GET'])
+def analysis_api(analysis_id):
+    try:
+        include_json = request.args.get('omit_json', '').lower() not in ('1', 'true', 'yes')
+        analysis = get_history_row(conn, 'analysis_results', analysis_id, include_json=include_json)
+        if analysis is None:
+            return jsonify({'status': 'FAIL', 'error': 'Analysis not found'}), 404
+        return jsonify(analysis)
+    except Exception as e:
+        logging.error(f"Analysis API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
+@app.route('/api/cluster-analyses', methods=['GET'])
+def cluster_analyses_api():
+    try:
+        page = page_history(conn, 'cluster_analysis', key=request.args.get('cluster_name'), **history_params())
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'status': 'FAIL', 'error': f'Invalid parameters: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"Cluster analyses API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
+@app.route('/api/cluster-analyses/<int:cluster_id>', methods=['GET'])
+def cluster_analysis_api(cluster_id):
+    try:
+        include_json = request.args.get('omit_json', '').lower() not in ('1', 'true', 'yes')
+        cluster = get_history_row(conn, 'cluster_analysis', cluster_id, include_json=include_json)
+        if cluster is None:
+            return jsonify({'status': 'FAIL', 'error': 'Cluster analysis not found'}), 404
+        return jsonify(cluster)
+    except Exception as e:
+        logging.error(f"Cluster analysis API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
+@app.route('/api/trends', methods=['GET'])
+def trends_api():
+    try:
+        today = datetime.now().date()
+        end_day = request.args.get('end') or today.isoformat()
+        start_day = request.args.get('start') or (
+            datetime.strptime(end_day, "%Y-%m-%d").date() - timedelta(days=int(request.args.get('days', 30)) - 1)
+        ).isoformat()
+        for day in (start_day, end_day):
+            datetime.strptime(day, "%Y-%m-%d")
+        limit = min(int(request.args.get('limit', 10)), 100)
+        series = request.args.get('series', '').lower() in ('1', 'true', 'yes')
+        return jsonify(query_trends(conn, start_day, end_day, limit=limit, series=series))
+    except ValueError as e:
+        return jsonify({'status': 'FAIL', 'error': f'Invalid parameters: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"Trends API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
+@app.route('/api/similar', methods=['GET'])
+def similar_api():
+    try:
+        image_url = request.args.get('image_url')
+        if not image_url:
+            return jsonify({'status': 'FAIL', 'error': 'No image URL provided'}), 400
+        if get_similarity_index() is None:
+            return jsonify({'status': 'FAIL', 'error': 'Similarity search is disabled'}), 503
+        k = min(int(request.args.get('k', 10)), MAX_SIMILAR_RESULTS)
+        nprobe = int(request.args['nprobe']) if 'nprobe' in request.args else None
+        if k < 1 or (nprobe is not None and nprobe < 1):
+            raise ValueError('k and nprobe must be positive')
+        results = find_similar(image_url, k=k, nprobe=nprobe)
+        if results is None:
+            return jsonify({'status': 'FAIL', 'error': 'Image has not been analyzed'}), 404
+        return jsonify({
+            'image_url': image_url,
+            'model': EMBEDDING_MODEL,
+            'results': [{'image_url': url, 'similarity': round(score, 4)} for url, score in results]
+        })
+    except ValueError as e:
+        return jsonify({'status': 'FAIL', 'error': f'Invalid parameters: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"Similarity API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status_api(job_id):
+    try:
+        job = get_job_queue().get(job_id)
+        if job is None:
+            return jsonify({'status': 'FAIL', 'error': 'Job not found'}), 404
+        return jsonify(job)
+    except Exception as e:
+        logging.error(f"Job status API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel_api(job_id):
+    try:
+        job = get_job_queue().cancel(job_id)
+        if job is None:
+            return jsonify({'status': 'FAIL', 'error': 'Job not found'}), 404
+        return jsonify(job)
+    except Exception as e:
+        logging.error(f"Job cancel API error: {str(e)}")
+        return jsonify({'status': 'FAIL', 'error': str(e)}), 500
+
+if MAIN_PROCESS:
+    cold_start = time.perf_counter() - _import_started
+    if cold_start > COLD_START_BUDGET:
+        logging.warning(f"Cold start took {cold_start:.2f}s, over the {COLD_START_BUDGET:.1f}s budget")
+    else:
+        logging.info(f"Cold start took {cold_start:.2f}s")
+    if WARMUP:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    # Resume anything left queued by the previous run. The debug reloader's
+    # parent process only watches files, so jobs start in its child.
+    if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        get_job_queue()
+
 if __name__ == "__main__":
     if not conn:
         logging.error("Database initialization failed, exiting...")
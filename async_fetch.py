@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+class AsyncFetcher:
+    """Fetches many URLs concurrently on an asyncio event loop.
+
+    Each URL is fetched by fetch_func(url, etag=...) on a shared thread pool,
+    so the blocking HTTP stack (pooled session, disk cache, size limits) is
+    reused as-is. At most per_host requests run against one host at a time,
+    across every fetch_all call sharing the fetcher. Failures are retried
+    with exponential backoff and full jitter, and whatever is still pending
+    at the deadline is abandoned: deadline seconds after the call, or at the
+    time.monotonic() value passed as deadline_at, so that several calls made
+    for one request can share one deadline.
+    """
+
+    # How often a fetch waiting for a busy host checks for a free slot
+    HOST_POLL_INTERVAL = 0.01
+
+    def __init__(self, fetch_func, per_host=4, max_concurrency=32, retries=3,
+                 base_delay=0.5, max_delay=8.0, deadline=60.0, no_retry=()):
+        self.fetch_func = fetch_func
+        self.per_host = per_host
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.no_retry = tuple(no_retry)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='fetch')
+        self._host_limits = {}
+        self._host_limits_lock = threading.Lock()
+
+    def backoff(self, attempt):
+        """Full-jitter delay before retry number attempt (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def _acquire_host(self, host, deadline_at):
+        """Take one of host's per_host slots; returns the semaphore, or None once the deadline passes.
+
+        The slots are shared by calls running on other threads' event loops,
+        so they are threading semaphores, polled rather than awaited.
+        """
+        with self._host_limits_lock:
+            limit = self._host_limits.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        while not limit.acquire(blocking=False):
+            if time.monotonic() >= deadline_at:
+                return None
+            await asyncio.sleep(self.HOST_POLL_INTERVAL)
+        return limit
+
+    async def _fetch_one(self, url, etag, deadline_at):
+        loop = asyncio.get_running_loop()
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries):
+            try:
+                limit = await self._acquire_host(host, deadline_at)
+                if limit is None:
+                    break
+                try:
+                    return await loop.run_in_executor(self._executor, lambda: self.fetch_func(url, etag=etag))
+                finally:
+                    limit.release()
+            except self.no_retry as e:
+                logging.error(f"Rejected image from {url}: {str(e)}")
+                return None
+            except Exception as e:
+                logging.warning(f"Attempt {attempt+1} failed for {url}: {str(e)}")
+                if attempt == self.retries - 1:
+                    break
+                delay = self.backoff(attempt)
+                if time.monotonic() + delay >= deadline_at:
+                    break
+                await asyncio.sleep(delay)
+        logging.error(f"Failed to load image from {url} after {attempt+1} attempts")
+        return None
+
+    async def _fetch_all(self, urls, etags, deadline_at):
+        if not urls:
+            return []
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            logging.error(f"Fetch deadline already passed, {len(urls)} URLs abandoned")
+            return [None] * len(urls)
+        tasks = [asyncio.ensure_future(self._fetch_one(url, etag, deadline_at))
+                 for url, etag in zip(urls, etags)]
+        done, pending = await asyncio.wait(tasks, timeout=None if math.isinf(remaining) else remaining)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logging.error(f"Fetch deadline hit, {len(pending)} of {len(tasks)} URLs abandoned")
+        return [task.result() if task in done and not task.cancelled() else None for task in tasks]
+
+    def fetch_all(self, urls, etags=None, deadline_at=None):
+        """Fetch urls concurrently; returns fetch_func results in order, None for failures."""
+        etags = etags or [None] * len(urls)
+        if deadline_at is None:
+            deadline_at = time.monotonic() + self.deadline
+        return asyncio.run(self._fetch_all(list(urls), list(etags), deadline_at))
+
+    def fetch(self, url, etag=None):
+        return self.fetch_all([url], [etag])[0]
@@ -1,6 +1,7 @@
 import os
 # from backend.extract import get_color_data
 from extract import get_color_data
+from dataset_index import DatasetIndex
 from flask import Flask, request, jsonify
 from flask_jwt_extended import JWTManager, create_access_token
 from flask_cors import CORS
@@ -22,6 +23,9 @@ app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
 db.init_app(app)
 jwt = JWTManager(app)
 
+# Per-file index of dataset colors, so /api/colors only processes new or changed images
+color_index = DatasetIndex(os.path.join(app.instance_path, 'dataset_index.db'))
+
 # Function to check allowed file extensions
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
@@ -76,7 +80,7 @@ def login():
 @app.route('/api/colors', methods=['GET'])
 def get_colors():
     folder_path = 'datasets'  
-    color_data = get_color_data(folder_path)  
+    color_data = get_color_data(folder_path, index=color_index)
     return jsonify(color_data)
 
 
@@ -0,0 +1,65 @@
+import numpy as np
+import webcolors
+
+class ColorNamer:
+    """Maps RGB values to the nearest named color in a fixed palette.
+
+    The palette matrix and its squared norms are computed once, so naming a
+    batch of colors is a single matrix product and argmin instead of one
+    nearest-neighbour search per color.
+    """
+
+    def __init__(self, palette=None, chunk_size=65536):
+        if palette is None:
+            palette = {name: tuple(webcolors.name_to_rgb(name)) for name in webcolors.names("css3")}
+        # Stored in reverse, so argmin (which returns the first minimum) picks
+        # the entry listed last among equally close ones. That is the name the
+        # old per-color scan returned: it kept the last name for each distance,
+        # e.g. 'grey' over 'gray' and 'cyan' over 'aqua'.
+        self.names = np.array(list(palette.keys())[::-1])
+        self.rgb = np.array(list(palette.values())[::-1], dtype=np.float64)
+        self.sq_norms = (self.rgb ** 2).sum(axis=1)
+        self.chunk_size = chunk_size
+
+    def indices(self, rgb_array):
+        """Return palette indices for an (n, 3) array of RGB values."""
+        rgb = np.asarray(rgb_array, dtype=np.float64).reshape(-1, 3)
+        result = np.empty(len(rgb), dtype=np.intp)
+        for start in range(0, len(rgb), self.chunk_size):
+            block = rgb[start:start + self.chunk_size]
+            # |x - p|^2 = |x|^2 - 2 x.p + |p|^2; |x|^2 is constant per row
+            distances = self.sq_norms[None, :] - 2.0 * block @ self.rgb.T
+            result[start:start + len(block)] = distances.argmin(axis=1)
+        return result
+
+    def name_colors(self, rgb_array):
+        """Return the color names for an (n, 3) array of RGB values."""
+        return self.names[self.indices(rgb_array)]
+
+_default_namer = None
+
+def get_namer():
+    """Return the process-wide CSS3 color namer."""
+    global _default_namer
+    if _default_namer is None:
+        _default_namer = ColorNamer()
+    return _default_namer
+
+def name_colors(rgb_array):
+    """
+    Names a batch of colors against the CSS3 palette.
+
+    Args:
+    rgb_array (array-like): RGB values with shape (n, 3).
+
+    Returns:
+    list: Color name for each input row.
+    """
+    rgb_array = np.asarray(rgb_array).reshape(-1, 3)
+    if len(rgb_array) == 0:
+        return []
+    return get_namer().name_colors(rgb_array).tolist()
+
+def hex_to_rgb_array(hex_colors):
+    """Convert a sequence of '#rrggbb' strings to an (n, 3) array."""
+    return np.array([tuple(webcolors.hex_to_rgb(h)) for h in hex_colors], dtype=np.uint8).reshape(-1, 3)
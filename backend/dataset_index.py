@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+class DatasetIndex:
+    """Persistent per-file index of dataset color results.
+
+    Each image is stored under its absolute path together with the size and
+    mtime it had when it was processed and the processing parameters. A scan
+    only re-processes files that are new or whose size, mtime or parameters
+    changed, serves everything else from the index, and drops rows for files
+    that have disappeared.
+    """
+
+    def __init__(self, db_path="dataset_index.db", commit_every=100):
+        self.commit_every = commit_every
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS dataset_images (
+                path TEXT PRIMARY KEY,
+                folder TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                dominant_json TEXT,
+                palette_json TEXT,
+                indexed_at REAL NOT NULL,
+                params TEXT NOT NULL DEFAULT ''
+            )
+        ''')
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(dataset_images)')]
+        if 'params' not in columns:
+            self._conn.execute("ALTER TABLE dataset_images ADD COLUMN params TEXT NOT NULL DEFAULT ''")
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_dataset_images_folder ON dataset_images (folder)')
+        self._conn.commit()
+
+    @staticmethod
+    def list_images(folder_path):
+        """Return (name, path, size, mtime_ns) for each image file in folder_path, sorted by name."""
+        entries = []
+        with os.scandir(folder_path) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    stat = entry.stat()
+                    entries.append((entry.name, os.path.abspath(entry.path), stat.st_size, stat.st_mtime_ns))
+        # scandir order depends on the filesystem; sorting matches the unindexed
+        # listing, so most_common ties in the summary resolve the same either way
+        return sorted(entries)
+
+    def scan(self, folder_path, process_func, params=''):
+        """Bring the index for folder_path up to date and return its results.
+
+        process_func(paths) is called once with the paths of new or changed
+        images and must return one (dominant_color, palette) pair, or None for
+        unreadable images, per path. Rows indexed with different params are
+        treated as changed. Returns {name: (dominant_color, palette)}
+        for every readable image, sorted by file name.
+        """
+        folder = os.path.abspath(folder_path)
+        with self._lock:
+            entries = self.list_images(folder_path)
+            indexed = {
+                row[0]: row[1:]
+                for row in self._conn.execute(
+                    'SELECT path, size, mtime_ns, dominant_json, palette_json, params FROM dataset_images WHERE folder = ?',
+                    (folder,)
+                )
+            }
+
+            results = {}
+            stale = []
+            for name, path, size, mtime_ns in entries:
+                row = indexed.get(path)
+                if row is not None and row[0] == size and row[1] == mtime_ns and row[4] == params:
+                    if row[2] is not None:
+                        results[name] = (tuple(json.loads(row[2])), [tuple(c) for c in json.loads(row[3])])
+                else:
+                    stale.append((name, path, size, mtime_ns))
+
+            if stale:
+                processed = process_func([path for _, path, _, _ in stale])
+                for i, ((name, path, size, mtime_ns), result) in enumerate(zip(stale, processed), 1):
+                    dominant, palette = result if result is not None else (None, None)
+                    if result is not None:
+                        results[name] = (tuple(dominant), [tuple(c) for c in palette])
+                    self._conn.execute('''
+                        INSERT OR REPLACE INTO dataset_images (
+                            path, folder, name, size, mtime_ns, dominant_json, palette_json, indexed_at, params
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        path, folder, name, size, mtime_ns,
+                        json.dumps(dominant) if result is not None else None,
+                        json.dumps(palette) if result is not None else None,
+                        time.time(),
+                        params
+                    ))
+                    if i % self.commit_every == 0:
+                        self._conn.commit()
+
+            present = {path for _, path, _, _ in entries}
+            removed = [(path,) for path in indexed if path not in present]
+            if removed:
+                self._conn.executemany('DELETE FROM dataset_images WHERE path = ?', removed)
+            self._conn.commit()
+
+        order = {name: i for i, (name, _, _, _) in enumerate(entries)}
+        return dict(sorted(results.items(), key=lambda item: order[item[0]]))
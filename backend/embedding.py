@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+
+# Compact per-image embedding for similarity search: a Lab color histogram
+# of the garment pixels plus the texture features the pattern classifier
+# already computes. Both parts are unit-normalized and weighted so that the
+# dot product of two embeddings is
+#   (1 - TEXTURE_WEIGHT) * color similarity + TEXTURE_WEIGHT * texture similarity
+
+# Bumped whenever the layout or weighting changes; vectors from different models are not comparable
+EMBEDDING_MODEL = 'lab-texture-v1'
+LAB_BINS = (4, 6, 6)
+TEXTURE_DIM = 8  # texture.FEATURE_NAMES without the trailing bias column
+EMBEDDING_DIM = int(np.prod(LAB_BINS)) + TEXTURE_DIM
+TEXTURE_WEIGHT = 0.25
+
+def lab_histograms(images, masks=None):
+    """(B, prod(LAB_BINS)) Hellinger-normalized Lab histograms of BGR images' foreground pixels."""
+    histograms = np.zeros((len(images), int(np.prod(LAB_BINS))), dtype=np.float32)
+    for i, image in enumerate(images):
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+        mask = masks[i] if masks is not None else None
+        pixels = lab[mask] if mask is not None else lab.reshape(-1, 3)
+        if not len(pixels):
+            continue
+        bins = (pixels.astype(np.int32) * np.array(LAB_BINS)) // 256
+        index = (bins[:, 0] * LAB_BINS[1] + bins[:, 1]) * LAB_BINS[2] + bins[:, 2]
+        histograms[i] = np.bincount(index, minlength=histograms.shape[1])
+    # sqrt of the normalized counts: the dot product becomes the Bhattacharyya coefficient
+    histograms /= np.maximum(histograms.sum(axis=1, keepdims=True), 1.0)
+    return np.sqrt(histograms)
+
+def image_embeddings(images, masks, features):
+    """(B, EMBEDDING_DIM) unit-length float32 embeddings.
+
+    features is the texture_features matrix for the same images and masks.
+    """
+    color = lab_histograms(images, masks)
+    color /= np.maximum(np.linalg.norm(color, axis=1, keepdims=True), 1e-12)
+    features = np.asarray(features, dtype=np.float32)
+    if features.shape[1] != TEXTURE_DIM + 1:
+        raise ValueError(f"Expected {TEXTURE_DIM + 1} texture features, got {features.shape[1]}")
+    # Features are roughly in [0, 1]; centering them makes the cosine favour matching textures
+    texture = features[:, :TEXTURE_DIM] - 0.5
+    texture /= np.maximum(np.linalg.norm(texture, axis=1, keepdims=True), 1e-12)
+    return np.hstack([
+        color * np.sqrt(1 - TEXTURE_WEIGHT),
+        texture * np.sqrt(TEXTURE_WEIGHT)
+    ]).astype(np.float32)
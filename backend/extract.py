@@ -1,8 +1,21 @@
 import os
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import cv2
 import numpy as np
-from colorthief import ColorThief
-import webcolors
+from colorthief import MMCQ
+from color_names import name_colors
+from segmentation import foreground_mask
+
+# Worker processes for folder scans, and the smallest batch worth shipping to them
+PROCESS_WORKERS = int(os.environ.get('FASHION_EXTRACT_WORKERS', os.cpu_count() or 1))
+PARALLEL_MIN_IMAGES = int(os.environ.get('FASHION_EXTRACT_PARALLEL_MIN', 16))
+# Garment segmentation applied before palette extraction: 'grabcut', 'center' or 'none'
+SEGMENTATION_MODE = os.environ.get('FASHION_SEGMENTATION', 'grabcut')
+_pool = None
+_pool_workers = None
 
 def apply_graph_cut(image_path):
     """Apply Graph Cut to segment cloth area."""
@@ -16,20 +29,9 @@ def apply_graph_cut(image_path):
     # Resize image for faster processing (optional)
     image = cv2.resize(image, (500, 500))
     
-    # Prepare mask for grabCut
-    mask = np.zeros(image.shape[:2], np.uint8)
-    
-    # Initialize background and foreground models
-    bgd_model = np.zeros((1, 65), np.float64)
-    fgd_model = np.zeros((1, 65), np.float64)
-    
-    # Apply grabCut algorithm
-    rect = (10, 10, image.shape[1] - 10, image.shape[0] - 10)  # Define the rectangle covering most of the image
-    cv2.grabCut(image, mask, rect, bgd_model, fgd_model, 5, cv2.GC_INIT_WITH_RECT)
-
-    # Modify mask to separate background and foreground
-    mask2 = np.where((mask == 2) | (mask == 0), 0, 1).astype('uint8')
-    segmented_image = image * mask2[:, :, np.newaxis]
+    # GrabCut runs on a small copy and its mask is upsampled back
+    mask = foreground_mask(image, 'grabcut')
+    segmented_image = image * mask[:, :, np.newaxis].astype(image.dtype)
     
     return segmented_image
 
@@ -43,84 +45,130 @@ def closest_color(requested_color):
     Returns:
     str: Name of the closest color.
     """
-    min_colors = {}
-    for name in webcolors.names("css3"):
-        r_c, g_c, b_c = webcolors.name_to_rgb(name)
-        distance = ((r_c - requested_color[0]) ** 2 +
-                    (g_c - requested_color[1]) ** 2 +
-                    (b_c - requested_color[2]) ** 2)
-        min_colors[distance] = name
-    return min_colors[min(min_colors.keys())]
-
-def extract_dominant_color(image):
-    """Use ColorThief to extract the dominant color."""
-    # Convert the image to RGB and save temporarily for ColorThief
-    temp_path = 'temp_image.jpg'
-    cv2.imwrite(temp_path, image)
-    
-    # Use ColorThief to get the dominant color and palette
-    color_thief = ColorThief(temp_path)
-    dominant_color = color_thief.get_color(quality=1)
-    palette = color_thief.get_palette(color_count=6)
+    return name_colors([requested_color])[0]
+
+def array_palette(image, color_count=10, quality=10, mask=None):
+    """ColorThief's median-cut palette computed straight from a BGR image array.
+
+    Samples every `quality`-th pixel and drops near-white ones exactly as
+    ColorThief.get_palette does, but with NumPy instead of a per-pixel loop
+    over a re-decoded file. With a mask, only foreground pixels are used.
+    """
+    rgb = image[..., ::-1]
+    pixels = (rgb[mask] if mask is not None else rgb.reshape(-1, 3))[::quality]
+    pixels = pixels[~np.all(pixels > 250, axis=1)]
+    return MMCQ.quantize(pixels.tolist(), color_count).palette
+
+def extract_dominant_color(image, mask=None):
+    """Use ColorThief's quantizer to extract the dominant color, in memory."""
+    # Same parameters as ColorThief.get_color(quality=1) and get_palette(color_count=6)
+    dominant_color = array_palette(image, color_count=5, quality=1, mask=mask)[0]
+    palette = array_palette(image, color_count=6, mask=mask)
     
     # Exclude black from the palette
     filtered_palette = [color for color in palette if color != (0, 0, 0)]
     
     return dominant_color, filtered_palette
 
-def process_images_in_folder(folder_path):
-    """Process all images in the specified folder."""
-    color_summary = {}
-    dataset_palette = []
-
-    for image_name in os.listdir(folder_path):
-        if image_name.lower().endswith(('.jpg', '.jpeg', '.png')):
-            image_path = os.path.join(folder_path, image_name)
-            
-            # Load the image
-            image = cv2.imread(image_path)
-            if image is None:
-                print(f"Error loading image {image_name}")
-                continue
-            
-            # Step 1: Extract dominant color and palette
-            dominant_color, palette = extract_dominant_color(image)
-            
-            # Convert RGB colors to human-readable names
-            dominant_color_name = closest_color(dominant_color)
-            palette_names = [closest_color(color) for color in palette[:3]]  # Take top 3 non-black colors
-            
-            # Add the palette to the dataset-wide collection
-            dataset_palette.extend(palette)
-            
-            # Store results
-            color_summary[image_name] = {
-                'dominant_color_name': dominant_color_name,
-                'palette_names': palette_names
-            }
-    
-    # Compute the top 3 colors across the whole dataset
-    all_colors = [color for color in dataset_palette if color != (0, 0, 0)]
-    top_colors = sorted(set(all_colors), key=all_colors.count, reverse=True)[:3]
-    top_color_names = [closest_color(color) for color in top_colors]
-    
-    return color_summary, top_color_names
+def analyze_image_file(image_path, segmentation=None):
+    """Return (dominant_color, palette) of an image file's garment pixels, or None if it cannot be loaded."""
+    image = cv2.imread(image_path)
+    if image is None:
+        print(f"Error loading image {os.path.basename(image_path)}")
+        return None
+    mask = foreground_mask(image, segmentation or SEGMENTATION_MODE)
+    return extract_dominant_color(image, mask=mask)
 
-# Path to the folder containing images
-folder_path = 'datasets'
+def analyze_image_files(image_paths, segmentation=None):
+    """Analyze a shard of image files; one result (or None) per path, in order."""
+    return [analyze_image_file(path, segmentation) for path in image_paths]
 
-# Process the images and get the dominant colors
-color_summary, dataset_top_colors = process_images_in_folder(folder_path)
+def _init_worker():
+    # One OpenCV thread per process; the pool already uses every core
+    cv2.setNumThreads(1)
 
-# Print the results for each image
-for image_name, colors in color_summary.items():
-    print(f"{image_name}: Dominant Color: {colors['dominant_color_name']}, Top 3 Colors: {colors['palette_names']}")
+def get_pool(workers):
+    """Return the shared process pool, (re)creating it for a new worker count."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown()
+        # spawn rather than fork: forked children can deadlock on OpenCV's thread pool
+        _pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker
+        )
+        _pool_workers = workers
+    return _pool
 
-# Print the top 3 colors across the whole dataset
-print(f"Top 3 Colors across the dataset: {dataset_top_colors}")
-def get_color_data(folder_path):
-    color_summary, dataset_top_colors = process_images_in_folder(folder_path)
+def analyze_images_parallel(image_paths, workers=None, segmentation=None):
+    """Analyze image files, sharding them across a process pool when it pays off."""
+    workers = workers or PROCESS_WORKERS
+    segmentation = segmentation or SEGMENTATION_MODE
+    if workers <= 1 or len(image_paths) < PARALLEL_MIN_IMAGES:
+        return analyze_image_files(image_paths, segmentation)
+    # Several contiguous shards per worker keep the cores busy when image sizes vary
+    shard_size = max(1, -(-len(image_paths) // (workers * 4)))
+    shards = [image_paths[i:i + shard_size] for i in range(0, len(image_paths), shard_size)]
+    results = []
+    for shard_results in get_pool(workers).map(analyze_image_files, shards, repeat(segmentation)):
+        results.extend(shard_results)
+    return results
+
+def process_images_in_folder(folder_path, index=None, workers=None, segmentation=None):
+    """Process all images in the specified folder.
+
+    With a DatasetIndex, only new or changed files are analyzed; the rest
+    come from the index. Images are analyzed across `workers` processes
+    (default: all cores), using only the pixels kept by `segmentation`.
+    """
+    segmentation = segmentation or SEGMENTATION_MODE
+    analyze = lambda paths: analyze_images_parallel(paths, workers=workers, segmentation=segmentation)
+    if index is not None:
+        results = index.scan(folder_path, analyze, params=f"segmentation={segmentation}")
+    else:
+        names = sorted(n for n in os.listdir(folder_path) if n.lower().endswith(('.jpg', '.jpeg', '.png')))
+        analyzed = analyze([os.path.join(folder_path, n) for n in names])
+        results = {name: result for name, result in zip(names, analyzed) if result is not None}
+
+    # Convert every dominant color and top 3 non-black palette color to a name in one batch
+    colors = []
+    for dominant_color, palette in results.values():
+        colors.append(dominant_color)
+        colors.extend(palette[:3])
+    names = iter(name_colors(colors)) if colors else iter(())
+
+    color_summary = {}
+    palette_counts = Counter()
+    for image_name, (dominant_color, palette) in results.items():
+        color_summary[image_name] = {
+            'dominant_color_name': next(names),
+            'palette_names': [next(names) for _ in palette[:3]]
+        }
+        palette_counts.update(color for color in palette if color != (0, 0, 0))
+
+    # Top 3 colors across the whole dataset, in one linear pass over the counts
+    top_colors = [color for color, _ in palette_counts.most_common(3)]
+    top_color_names = name_colors(top_colors) if top_colors else []
+    
+    return color_summary, top_color_names
+
+def get_color_data(folder_path, index=None, workers=None):
+    color_summary, dataset_top_colors = process_images_in_folder(folder_path, index=index, workers=workers)
     return {
         "color_summary": color_summary,
         "dataset_top_colors": dataset_top_colors
     }
+
+if __name__ == '__main__':
+    # Path to the folder containing images
+    folder_path = 'datasets'
+
+    # Process the images and get the dominant colors
+    color_summary, dataset_top_colors = process_images_in_folder(folder_path)
+
+    # Print the results for each image
+    for image_name, colors in color_summary.items():
+        print(f"{image_name}: Dominant Color: {colors['dominant_color_name']}, Top 3 Colors: {colors['palette_names']}")
+
+    # Print the top 3 colors across the whole dataset
+    print(f"Top 3 Colors across the dataset: {dataset_top_colors}")
@@ -0,0 +1,139 @@
+import cv2
+import numpy as np
+
+# CPU pattern classifier on hand-built texture features. Every feature is
+# computed for a whole stack of thumbnails at once, and classes are scored
+# with one matrix product, so batches cost little more than single images.
+
+# Bumped whenever the features or weights change, so cached reports are recomputed
+PATTERN_MODEL = 'texture-v1'
+PATTERN_CLASSES = ('striped', 'checked', 'floral', 'geometric', 'plain')
+FEATURE_NAMES = (
+    'edge_density',           # share of foreground pixels on a strong edge
+    'contrast',               # intensity standard deviation, scaled to about [0, 1]
+    'orientation_dominance',  # share of edge energy around the strongest orientation
+    'orthogonal_share',       # share of edge energy around the orientation 90 degrees away
+    'orientation_entropy',    # normalized entropy of the edge orientation histogram
+    'periodicity',            # share of spectral power in the strongest few frequencies
+    'lbp_entropy',            # normalized entropy of the uniform LBP histogram
+    'lbp_flat',               # share of flat (all-equal) LBP neighborhoods
+    'bias'
+)
+
+# One row of weights per class, one column per feature; fit by multinomial
+# logistic regression on synthetic swatches of each pattern and rounded
+PATTERN_WEIGHTS = np.array([
+    # edge  contr  dom   orth  ent   per   lbpE  flat  bias
+    [ 0.5, -2.0,  4.4, -3.3, -2.4,  3.4,  0.4, -0.3,  0.5],  # striped
+    [ 1.7, -0.8, -0.4,  7.4, -2.6,  3.2,  0.6, -0.5,  0.6],  # checked
+    [ 2.3,  0.5, -3.8, -1.2,  3.0, -4.5,  5.7, -3.2,  0.3],  # floral
+    [-3.5,  4.5,  0.5, -2.5,  1.6,  0.4, -0.5,  0.4, -1.4],  # geometric
+    [-1.0, -2.2, -0.8, -0.3,  0.3, -2.5, -6.2,  3.6, -0.1],  # plain
+])
+
+TEXTURE_SIZE = 128
+ORIENTATION_BINS = 12
+EDGE_THRESHOLD = 0.25
+LBP_TOLERANCE = 0.02
+
+def prepare_stack(images, masks=None, size=TEXTURE_SIZE):
+    """Grayscale size x size stack of BGR (or gray) images plus eroded foreground weights.
+
+    Background pixels are filled with the foreground mean so the mask
+    outline does not register as texture.
+    """
+    grays = np.empty((len(images), size, size), dtype=np.float32)
+    weights = np.ones((len(images), size, size), dtype=np.float32)
+    kernel = np.ones((5, 5), np.uint8)
+    for i, image in enumerate(images):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        grays[i] = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+        mask = masks[i] if masks is not None else None
+        if mask is not None:
+            small = cv2.resize(mask.astype(np.uint8), (size, size), interpolation=cv2.INTER_NEAREST)
+            small = cv2.erode(small, kernel)
+            if small.mean() >= 0.05:
+                weights[i] = small
+                grays[i][small == 0] = grays[i][small > 0].mean()
+    return grays, weights
+
+def _entropy(histograms):
+    p = histograms / np.maximum(histograms.sum(axis=1, keepdims=True), 1e-12)
+    return -(p * np.log(np.where(p > 0, p, 1))).sum(axis=1) / np.log(histograms.shape[1])
+
+def texture_features(grays, weights):
+    """(B, len(FEATURE_NAMES)) feature matrix for a (B, H, W) grayscale stack in [0, 1]."""
+    n_images, h, w = grays.shape
+    if n_images == 0:
+        return np.empty((0, len(FEATURE_NAMES)))
+    inner = weights[:, 1:-1, 1:-1]
+    inner_area = np.maximum(inner.sum(axis=(1, 2)), 1.0)
+
+    # Sobel gradients on the whole stack
+    g = grays
+    gx = (g[:, :-2, 2:] + 2 * g[:, 1:-1, 2:] + g[:, 2:, 2:]) - (g[:, :-2, :-2] + 2 * g[:, 1:-1, :-2] + g[:, 2:, :-2])
+    gy = (g[:, 2:, :-2] + 2 * g[:, 2:, 1:-1] + g[:, 2:, 2:]) - (g[:, :-2, :-2] + 2 * g[:, :-2, 1:-1] + g[:, :-2, 2:])
+    magnitude = np.hypot(gx, gy) * inner
+    edge_density = (magnitude > EDGE_THRESHOLD).sum(axis=(1, 2)) / inner_area
+
+    # Edge orientation histogram over [0, pi), weighted by gradient magnitude
+    theta = np.mod(np.arctan2(gy, gx), np.pi)
+    bins = np.minimum((theta / np.pi * ORIENTATION_BINS).astype(np.intp), ORIENTATION_BINS - 1)
+    index = (bins + (np.arange(n_images) * ORIENTATION_BINS)[:, None, None]).ravel()
+    orientation = np.bincount(index, weights=magnitude.ravel(), minlength=n_images * ORIENTATION_BINS)
+    orientation = orientation.reshape(n_images, ORIENTATION_BINS)
+    orientation /= np.maximum(orientation.sum(axis=1, keepdims=True), 1e-12)
+    # Each bin plus its two neighbours, so a peak straddling two bins is not split
+    smoothed = orientation + np.roll(orientation, 1, axis=1) + np.roll(orientation, -1, axis=1)
+    peak = smoothed.argmax(axis=1)
+    rows = np.arange(n_images)
+    dominance = smoothed[rows, peak]
+    orthogonal = smoothed[rows, (peak + ORIENTATION_BINS // 2) % ORIENTATION_BINS]
+    orientation_entropy = _entropy(orientation)
+
+    # Periodicity: power concentrated in a few spectral peaks (windowed, DC and shading removed)
+    means = (grays * weights).sum(axis=(1, 2)) / np.maximum(weights.sum(axis=(1, 2)), 1.0)
+    window = np.outer(np.hanning(h), np.hanning(w)).astype(np.float32)
+    power = np.abs(np.fft.rfft2((grays - means[:, None, None]) * weights * window)) ** 2
+    fy = np.minimum(np.arange(h), h - np.arange(h))[:, None]
+    fx = np.arange(power.shape[2])[None, :]
+    power[:, (fy ** 2 + fx ** 2) < 9] = 0
+    flat_power = power.reshape(n_images, -1)
+    top = np.partition(flat_power, -4, axis=1)[:, -4:].sum(axis=1)
+    periodicity = top / np.maximum(flat_power.sum(axis=1), 1e-12)
+
+    # Uniform 8-neighbour LBP with a small tolerance against sensor noise
+    center = g[:, 1:-1, 1:-1]
+    offsets = ((0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0), (1, 0))
+    bits = np.stack([g[:, dy:dy + h - 2, dx:dx + w - 2] >= center + LBP_TOLERANCE for dy, dx in offsets])
+    transitions = (bits != np.roll(bits, 1, axis=0)).sum(axis=0)
+    ones = bits.sum(axis=0)
+    codes = np.where(transitions <= 2, ones, 9)
+    lbp_index = (codes + (np.arange(n_images) * 10)[:, None, None]).ravel()
+    lbp = np.bincount(lbp_index, weights=inner.ravel(), minlength=n_images * 10).reshape(n_images, 10)
+    lbp_entropy = _entropy(lbp)
+    lbp_flat = lbp[:, 0] / inner_area
+
+    variance = (((grays - means[:, None, None]) ** 2) * weights).sum(axis=(1, 2)) / np.maximum(weights.sum(axis=(1, 2)), 1.0)
+    contrast = np.minimum(np.sqrt(variance) * 4, 1.0)
+
+    return np.stack([
+        edge_density, contrast, dominance, orthogonal, orientation_entropy,
+        periodicity, lbp_entropy, lbp_flat, np.ones(n_images)
+    ], axis=1)
+
+def pattern_predictions(features):
+    """Softmax pattern predictions for a texture_features matrix, one dict per row."""
+    scores = features @ PATTERN_WEIGHTS.T
+    scores -= scores.max(axis=1, keepdims=True)
+    probabilities = np.exp(scores)
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    predictions = []
+    for row in probabilities:
+        best = int(row.argmax())
+        predictions.append({
+            'predicted': PATTERN_CLASSES[best],
+            'confidence': round(float(row[best]), 4),
+            'all_options': {name: round(float(p), 4) for name, p in zip(PATTERN_CLASSES, row)}
+        })
+    return predictions
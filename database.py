@@ -0,0 +1,119 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+def connect(db_name, **kwargs):
+    """Open a SQLite connection in WAL mode.
+
+    WAL lets readers run alongside the writer, and synchronous=NORMAL means
+    commits no longer wait on fsync (only checkpoints do).
+    """
+    conn = sqlite3.connect(db_name, timeout=30, **kwargs)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+class Database:
+    """Single-writer access to the analysis database.
+
+    All writes are queued to one writer thread, which applies them in batches
+    of up to batch_size operations per transaction (group commit). Each write
+    runs in its own savepoint, so one failing operation does not roll back the
+    rest of its batch. Reads use one connection per calling thread.
+    """
+
+    def __init__(self, db_name, batch_size=200, flush_interval=0.05):
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name='db-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def reader(self):
+        """Return this thread's read connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect(self.db_name, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def write(self, func, *args):
+        """Queue func(cursor, *args) for the writer thread; returns a Future of its result."""
+        future = Future()
+        if self._closed:
+            future.set_exception(sqlite3.ProgrammingError("Database is closed"))
+            return future
+        self._queue.put((func, args, future))
+        return future
+
+    def flush(self):
+        """Block until every queued write has been committed."""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+
+    def _write_loop(self):
+        conn = connect(self.db_name, isolation_level=None)
+        running = True
+        while running:
+            item = self._queue.get()
+            batch = []
+            if item is None:
+                running = False
+            else:
+                batch.append(item)
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        running = False
+                        break
+                    batch.append(item)
+            if batch:
+                self._apply(conn, batch)
+            for _ in range(len(batch) + (0 if running else 1)):
+                self._queue.task_done()
+        conn.close()
+
+    def _apply(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute('BEGIN')
+            for func, args, future in batch:
+                conn.execute('SAVEPOINT write_op')
+                try:
+                    result = func(conn.cursor(), *args)
+                    conn.execute('RELEASE write_op')
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_op')
+                    conn.execute('RELEASE write_op')
+                    outcomes.append((future, None, e))
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            logging.error(f"Batch write of {len(batch)} operations failed: {str(e)}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            outcomes = [(future, None, e) for _, _, future in batch]
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+def create_session(pool_size=16):
+    """Return a requests.Session with a keep-alive connection pool shared across requests."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+class DiskImageCache:
+    """Bounded on-disk cache of fetched image bodies.
+
+    Each URL is stored as a body file plus a JSON sidecar holding its ETag
+    and Last-Modified validators. Entries are evicted least-recently-used
+    first once the bodies exceed max_bytes in total.
+    """
+
+    def __init__(self, cache_dir="image_cache", max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # url key -> body size, oldest first
+        self._total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.body', base + '.json'
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.body'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len('.body')], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+        logging.info(f"Image cache at {self.cache_dir}: {len(self._entries)} entries, {self._total_bytes} bytes")
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def validators(self, url):
+        """Return the cached metadata for url, or None if it is not cached."""
+        key = self.key_for(url)
+        with self._lock:
+            if key not in self._entries:
+                return None
+        try:
+            with open(self._paths(key)[1], 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def conditional_headers(self, url):
+        meta = self.validators(url)
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def read(self, url):
+        """Return the cached body for url and mark it recently used, or None."""
+        key = self.key_for(url)
+        body_path = self._paths(key)[0]
+        try:
+            with open(body_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            self._forget(key)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        try:
+            os.utime(body_path, None)
+        except OSError:
+            pass
+        return data
+
+    def store(self, url, data, etag=None, last_modified=None):
+        if len(data) > self.max_bytes or not (etag or last_modified):
+            return
+        key = self.key_for(url)
+        body_path, meta_path = self._paths(key)
+        meta = {'url': url, 'etag': etag, 'last_modified': last_modified, 'stored_at': time.time()}
+        try:
+            tmp_body = f"{body_path}.{threading.get_ident()}.tmp"
+            with open(tmp_body, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_body, body_path)
+            tmp_meta = f"{meta_path}.{threading.get_ident()}.tmp"
+            with open(tmp_meta, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_meta, meta_path)
+        except OSError as e:
+            logging.error(f"Failed to cache image {url}: {str(e)}")
+            return
+        with self._lock:
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            evicted = []
+            while self._total_bytes > self.max_bytes and self._entries:
+                old_key, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._remove_files(old_key)
+
+    def _forget(self, key):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+        self._remove_files(key)
+
+    def _remove_files(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
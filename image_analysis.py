@@ -0,0 +1,457 @@
+import logging
+import os
+import time
+from collections import Counter
+from io import BytesIO
+
+import cv2
+import numpy as np
+# sklearn is imported where it is used, so importing this module stays cheap
+from PIL import Image
+
+from backend.segmentation import foreground_mask
+from backend.texture import prepare_stack, texture_features, pattern_predictions
+from backend.embedding import image_embeddings
+from result_cache import content_digest
+
+# Per-image analysis: decoding, segmentation, color clustering, validation,
+# pattern and embedding. Nothing here touches the database, caches or the
+# network, and importing it has no side effects, so the spawned analysis
+# workers import this module instead of the Flask app.
+
+# 'exact' clusters every foreground thumbnail pixel, 'fast' clusters a color histogram
+COLOR_ENGINES = ('exact', 'fast')
+DEFAULT_COLOR_ENGINE = os.environ.get('FASHION_COLOR_ENGINE', 'exact')
+# 'simplified' scores every pixel against the centroids, 'sampled' is the exact pairwise score
+DEFAULT_SILHOUETTE_MODE = os.environ.get('FASHION_SILHOUETTE_MODE', 'simplified')
+# Garment segmentation before clustering: 'grabcut' (low-resolution GrabCut),
+# 'center' (fast center-weighted ellipse) or 'none' (every pixel)
+DEFAULT_SEGMENTATION = os.environ.get('FASHION_SEGMENTATION', 'grabcut')
+
+# Images are analyzed at this size; larger downloads are decoded straight to it
+ANALYSIS_MAX_SIZE = 200
+MAX_IMAGE_PIXELS = int(os.environ.get('FASHION_MAX_IMAGE_PIXELS', 50_000_000))
+# Images clustered together by one batched k-means in /api/analyze-batch; images
+# are grouped by size, and small groups keep the padding to the largest one low
+BATCH_CHUNK = int(os.environ.get('FASHION_BATCH_CHUNK', 8))
+
+# ====================== DECODING ======================
+class ImageTooLargeError(ValueError):
+    """Raised when an image exceeds the configured byte or pixel budget."""
+
+def decode_image_bytes(data, max_size=ANALYSIS_MAX_SIZE, max_pixels=MAX_IMAGE_PIXELS):
+    """Decode encoded image bytes straight to an analysis-size BGR array.
+
+    JPEGs are decoded with DCT scaling via Image.draft, so the full-resolution
+    bitmap is never materialized; other formats are decoded and shrunk in
+    place with Image.thumbnail before conversion to NumPy.
+    """
+    img = Image.open(BytesIO(data))
+    width, height = img.size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(f"Image has {width * height} pixels, limit is {max_pixels}")
+    if img.mode not in ('RGB', 'L'):
+        img.draft('RGB', (max_size, max_size))
+        img = img.convert('RGB')
+    else:
+        img.draft(img.mode, (max_size, max_size))
+    img.thumbnail((max_size, max_size))
+    img_array = np.asarray(img)
+    if img_array.size == 0:
+        raise ValueError("Empty image")
+    if img_array.ndim == 3:
+        img_array = np.ascontiguousarray(img_array[:, :, ::-1])  # RGB -> BGR, as cv2 decodes
+    return img_array
+
+def image_format(data):
+    """Return the format PIL identifies encoded bytes as, or None if they are not an image it can open.
+
+    Only the header is read, so this is cheap enough to check a request body
+    before anything is analyzed.
+    """
+    try:
+        with Image.open(BytesIO(data)) as img:
+            return img.format
+    except OSError:
+        return None
+
+# ====================== COLOR CLUSTERING ======================
+def color_histogram(pixels, bits=5):
+    """Collapse an (n, 3) pixel matrix into its non-empty quantized color bins.
+
+    Returns the mean color of each occupied bin, the pixel count of each bin
+    and, for every pixel, the index of the bin it fell into.
+    """
+    shift = 8 - bits
+    q = pixels.astype(np.int32) >> shift
+    keys = (q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]
+    bin_keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    bin_colors = np.empty((len(bin_keys), 3), dtype=np.float64)
+    for channel in range(3):
+        bin_colors[:, channel] = np.bincount(inverse, weights=pixels[:, channel], minlength=len(bin_keys)) / counts
+    return bin_colors, counts, inverse.reshape(-1)
+
+class AnalysisContext:
+    """Per-image state shared by color extraction and validation.
+
+    Holds the analysis-size thumbnail, its garment mask, the RGB matrix of
+    the foreground pixels and, once a clustering has been fitted, the
+    per-pixel labels and the centroids, so later stages reuse that work
+    instead of resizing, segmenting and clustering again. digest (of the
+    encoded image) keys the mask cache.
+    """
+
+    def __init__(self, img_array, max_size=ANALYSIS_MAX_SIZE, segmentation=None, digest=None):
+        h, w = img_array.shape[:2]
+        if h > max_size or w > max_size:
+            scale = max_size / max(h, w)
+            img_array = cv2.resize(img_array, (int(w * scale), int(h * scale)))
+        self.thumbnail = img_array
+        img_rgb = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB if len(img_array.shape) == 2 else cv2.COLOR_BGR2RGB)
+        self.mask = foreground_mask(img_array, segmentation or DEFAULT_SEGMENTATION, digest=digest)
+        self.pixels = img_rgb[self.mask] if self.mask is not None else img_rgb.reshape(-1, 3)
+        self.labels = None
+        self.centers = None
+
+def extract_dominant_colors(img_array, k=5, engine=None, hist_bits=5, context=None):
+    """Cluster the thumbnail's pixels into k dominant colors.
+
+    engine='exact' fits KMeans on every pixel; engine='fast' fits a
+    weighted KMeans on the non-empty bins of a hist_bits-per-channel color
+    histogram, which is far fewer points for the same result contract.
+    The fitted labels and centroids are left on the context for validation.
+    """
+    engine = engine or DEFAULT_COLOR_ENGINE
+    try:
+        if context is None:
+            context = AnalysisContext(img_array)
+        pixels = context.pixels
+        if len(pixels) < k:
+            logging.error("Too few pixels for clustering")
+            return []
+
+        from sklearn.cluster import KMeans
+        if engine == 'fast':
+            bin_colors, bin_counts, inverse = color_histogram(pixels, bits=hist_bits)
+            n_clusters = min(k, len(bin_colors))
+            kmeans = KMeans(n_clusters=n_clusters, n_init=3, random_state=42)
+            kmeans.fit(bin_colors, sample_weight=bin_counts)
+            labels = kmeans.labels_[inverse]
+        elif engine == 'exact':
+            kmeans = KMeans(n_clusters=k, n_init=3, random_state=42)
+            kmeans.fit(pixels)
+            labels = kmeans.labels_
+        else:
+            raise ValueError(f"Unknown color engine: {engine}")
+        center_colors = kmeans.cluster_centers_
+        context.labels = labels
+        context.centers = center_colors
+        return dominant_colors_from_labels(labels, center_colors)
+    except Exception as e:
+        logging.error(f"Color extraction failed: {str(e)}")
+        return []
+
+def dominant_colors_from_labels(labels, center_colors):
+    """Dominant color entries (color, percentage, hex) of a clustering, largest first."""
+    counts = Counter({i: int(c) for i, c in enumerate(np.bincount(labels, minlength=len(center_colors))) if c})
+    total = sum(counts.values())
+
+    dominant_colors = []
+    for i in counts.keys():
+        color = np.clip(center_colors[i], 0, 255).astype(int)
+        percentage = counts[i] / total
+        dominant_colors.append({
+            'color': color.tolist(),
+            'percentage': float(percentage),
+            'hex': '#%02x%02x%02x' % tuple(color)
+        })
+    dominant_colors.sort(key=lambda x: x['percentage'], reverse=True)
+    return dominant_colors
+
+def batched_kmeans(points, weights, k=5, n_init=3, max_iter=100, tol=1e-4, seed=42):
+    """Weighted Lloyd k-means for many images at once.
+
+    points is a (B, N, 3) stack of per-image point sets padded to a common
+    N, weights the matching (B, N) weights, with 0 for padding. Each image
+    gets k-means++ seeding, and the best of n_init runs by inertia is kept,
+    as with KMeans. Each image stops once its centers move less than tol
+    times its mean per-channel variance. Every step is a vectorized pass
+    over all images still running, so there is no per-image Python
+    overhead. Returns (labels (B, N), centers (B, k, 3)).
+    """
+    rng = np.random.default_rng(seed)
+    # Channel-major float32 so each distance pass is a few contiguous multiply-adds
+    X = np.ascontiguousarray(np.moveaxis(points, 2, 0), dtype=np.float32)
+    W = np.ascontiguousarray(weights, dtype=np.float32)
+    n_images, n_points = W.shape
+    rows = np.arange(n_images)
+    weight_totals = np.maximum(W.sum(axis=1), 1e-12)
+    means = (X * W).sum(axis=2) / weight_totals
+    variances = (((X - means[:, :, None]) ** 2) * W).sum(axis=2) / weight_totals
+    thresholds = tol * variances.mean(axis=0)
+    point_norms = (X ** 2).sum(axis=0)
+    WX = X * W
+
+    def assign(X, centers):
+        # argmin_j |c_j|^2 - 2 x.c_j, kept as a running minimum over the k centers
+        centers = centers.astype(np.float32)
+        for j in range(k):
+            c = centers[:, j]
+            score = X[0] * c[:, 0, None]
+            score += X[1] * c[:, 1, None]
+            score += X[2] * c[:, 2, None]
+            score *= -2
+            score += (c ** 2).sum(axis=1)[:, None]
+            if j == 0:
+                best, labels = score, np.zeros(score.shape, dtype=np.intp)
+            else:
+                closer = score < best
+                np.minimum(best, score, out=best)
+                labels[closer] = j
+        return labels, best
+
+    def update(W, WX, labels, centers):
+        index = (labels + (np.arange(len(W)) * k)[:, None]).ravel()
+        totals = np.bincount(index, weights=W.ravel(), minlength=len(W) * k).reshape(-1, k)
+        sums = np.stack([
+            np.bincount(index, weights=WX[c].ravel(), minlength=len(W) * k) for c in range(3)
+        ], axis=1).reshape(-1, k, 3)
+        # Empty clusters keep their previous center
+        return np.where(totals[:, :, None] > 0, sums / np.maximum(totals, 1e-12)[:, :, None], centers)
+
+    def sample(probabilities):
+        # One weighted draw per image
+        cumulative = np.cumsum(probabilities, axis=1)
+        draws = rng.random(n_images) * cumulative[:, -1]
+        return np.minimum((cumulative < draws[:, None]).sum(axis=1), n_points - 1)
+
+    def seed_centers():
+        # k-means++: each next center drawn proportionally to weight x squared distance
+        centers = np.empty((n_images, k, 3))
+        centers[:, 0] = X[:, rows, sample(W)].T
+        closest = ((X - centers[:, 0].T.astype(np.float32)[:, :, None]) ** 2).sum(axis=0)
+        for j in range(1, k):
+            probabilities = W * closest
+            # Images with fewer distinct colors than k fall back to weight-proportional draws
+            probabilities = np.where(probabilities.sum(axis=1, keepdims=True) > 0, probabilities, W)
+            centers[:, j] = X[:, rows, sample(probabilities)].T
+            np.minimum(closest, ((X - centers[:, j].T.astype(np.float32)[:, :, None]) ** 2).sum(axis=0), out=closest)
+        return centers
+
+    best_labels = best_centers = best_inertia = None
+    for _ in range(n_init):
+        centers = seed_centers()
+        active = rows
+        X_active, W_active, WX_active = X, W, WX
+        for _ in range(max_iter):
+            labels, _ = assign(X_active, centers[active])
+            new_centers = update(W_active, WX_active, labels, centers[active])
+            shift = ((new_centers - centers[active]) ** 2).sum(axis=(1, 2))
+            centers[active] = new_centers
+            converged = shift <= thresholds[active]
+            if converged.all():
+                break
+            if converged.any():
+                running = ~converged
+                active = active[running]
+                X_active, W_active, WX_active = X_active[:, running], W_active[running], WX_active[:, running]
+
+        labels, scores = assign(X, centers)
+        inertia = ((scores + point_norms) * W).sum(axis=1)
+        if best_inertia is None:
+            best_labels, best_centers, best_inertia = labels, centers, inertia
+        else:
+            better = inertia < best_inertia
+            best_labels = np.where(better[:, None], labels, best_labels)
+            best_centers = np.where(better[:, None, None], centers, best_centers)
+            best_inertia = np.minimum(inertia, best_inertia)
+    return best_labels, best_centers
+
+# ====================== VALIDATION ======================
+def simplified_silhouette(pixels, labels, centers):
+    """Centroid-based silhouette averaged over every pixel in O(n*k).
+
+    Uses the distance to the pixel's own centroid as a(i) and the distance
+    to the nearest other centroid as b(i), instead of the pairwise pixel
+    distances of the exact score.
+    """
+    if len(centers) < 2:
+        raise ValueError("Silhouette needs at least 2 clusters")
+    pixels = pixels.astype(np.float64)
+    distances = np.sqrt(((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2))
+    rows = np.arange(len(pixels))
+    a = distances[rows, labels]
+    distances[rows, labels] = np.inf
+    b = distances.min(axis=1)
+    denom = np.maximum(a, b)
+    scores = np.divide(b - a, denom, out=np.zeros_like(a), where=denom > 0)
+    return float(scores.mean())
+
+def validate_color_clustering(img_array, dominant_colors, k=5, context=None, silhouette_mode=None):
+    """Score the color clustering of an image.
+
+    silhouette_mode='simplified' computes the centroid-based silhouette over
+    every foreground pixel; 'sampled' computes the exact silhouette on a fixed
+    500-pixel sample.
+    """
+    silhouette_mode = silhouette_mode or DEFAULT_SILHOUETTE_MODE
+    validation_results = {'status': 'PASS', 'metrics': {}, 'warnings': []}
+    try:
+        if context is None:
+            context = AnalysisContext(img_array)
+        pixels = context.pixels
+        sample_size = min(500, len(pixels))
+        if sample_size < k:
+            validation_results['status'] = 'FAIL'
+            validation_results['error'] = "Too few pixels for clustering"
+            return validation_results
+
+        start_time = time.time()
+        if context.labels is None:
+            from sklearn.cluster import KMeans
+            kmeans = KMeans(n_clusters=k, n_init=3, random_state=42)
+            kmeans.fit(pixels)
+            context.labels = kmeans.labels_
+            context.centers = kmeans.cluster_centers_
+        if silhouette_mode == 'simplified':
+            silhouette = simplified_silhouette(pixels, context.labels, context.centers)
+        elif silhouette_mode == 'sampled':
+            rng = np.random.default_rng(42)
+            sample_indices = rng.choice(len(pixels), sample_size, replace=False)
+            from sklearn.metrics import silhouette_score
+            silhouette = float(silhouette_score(pixels[sample_indices], context.labels[sample_indices]))
+        else:
+            raise ValueError(f"Unknown silhouette mode: {silhouette_mode}")
+        validation_results['metrics']['silhouette_score'] = silhouette
+        validation_results['metrics']['silhouette_mode'] = silhouette_mode
+        logging.info(f"Silhouette took {time.time() - start_time:.2f} seconds")
+        if silhouette < 0.5:
+            validation_results['warnings'].append(f'Low silhouette score ({silhouette:.2f})')
+
+        color_values = np.array([c['color'] for c in dominant_colors])
+        color_variation = np.std(color_values, axis=0).mean()
+        validation_results['metrics']['color_variation'] = color_variation
+        if color_variation > 15:
+            validation_results['warnings'].append(f'High color variation ({color_variation:.2f})')
+
+        percentage_sum = sum(c['percentage'] for c in dominant_colors)
+        validation_results['metrics']['percentage_sum'] = percentage_sum
+        if abs(percentage_sum - 1.0) > 0.01:
+            validation_results['warnings'].append(f'Percentage sum incorrect ({percentage_sum:.2f})')
+
+        # visualize_color_validation(cv2.cvtColor(context.thumbnail, cv2.COLOR_BGR2RGB), dominant_colors, k)  # Commented out for API
+    except Exception as e:
+        validation_results['status'] = 'FAIL'
+        validation_results['error'] = str(e)
+        logging.error(f"Error in validate_color_clustering: {str(e)}")
+    return validation_results
+
+# ====================== PIPELINE ======================
+def analyze_image_data(data, engine=None, silhouette_mode=None):
+    """Decode, extract and validate one image's encoded bytes.
+
+    Touches no database, cache or network, so it can run in a worker
+    process. Returns (colors, color_validation, pattern, embedding), or None
+    on failure.
+    """
+    engine = engine or DEFAULT_COLOR_ENGINE
+    try:
+        img_array = decode_image_bytes(data)
+        logging.info("Image loaded")
+
+        context = AnalysisContext(img_array, digest=content_digest(data))
+        start_time = time.time()
+        colors = extract_dominant_colors(img_array, engine=engine, context=context)
+        if not colors:
+            return None
+        logging.info(f"Extracted colors ({engine}, {time.time() - start_time:.2f}s): {[c['hex'] for c in colors]}")
+
+        logging.info("Validating colors...")
+        color_validation = validate_color_clustering(img_array, colors, context=context, silhouette_mode=silhouette_mode)
+        logging.info(f"Color Validation Status: {color_validation['status']}")
+        if color_validation.get('warnings'):
+            logging.warning("Color validation warnings:")
+            for warning in color_validation['warnings']:
+                logging.warning(f"  - {warning}")
+
+        features = texture_features(*prepare_stack([context.thumbnail], [context.mask]))
+        pattern = pattern_predictions(features)[0]
+        logging.info(f"Pattern: {pattern['predicted']} ({pattern['confidence']:.2f})")
+        embedding = image_embeddings([context.thumbnail], [context.mask], features)[0]
+        return colors, color_validation, pattern, embedding
+    except Exception as e:
+        logging.error(f"Image analysis failed: {str(e)}")
+        return None
+
+def init_analysis_worker():
+    """ProcessPoolExecutor initializer for the spawned analysis workers."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Each worker handles one image at a time; keep BLAS/OpenMP from oversubscribing cores
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
+    import sklearn.cluster  # noqa: F401  (paid once per worker, not on its first image)
+
+def analyze_image_batch(datas, engine=None, silhouette_mode=None, k=5, hist_bits=5):
+    """Analyze many images' encoded bytes with one batched k-means.
+
+    Each image is decoded and segmented as in analyze_image_data. The
+    distinct foreground colors ('exact', weighted by pixel count, which is
+    the same objective as clustering every pixel) or histogram bins
+    ('fast') of up to BATCH_CHUNK images are then padded into one tensor
+    and clustered together by batched_kmeans. The fitted labels are left on each context,
+    so validation reuses them. Texture features, patterns and embeddings are
+    computed for the whole batch at once. Returns a (colors,
+    color_validation, pattern, embedding) tuple or None per image, in order.
+    """
+    engine = engine or DEFAULT_COLOR_ENGINE
+    if engine not in COLOR_ENGINES:
+        raise ValueError(f"Unknown color engine: {engine}")
+    prepared = []
+    for i, data in enumerate(datas):
+        try:
+            context = AnalysisContext(decode_image_bytes(data), digest=content_digest(data))
+        except Exception as e:
+            logging.error(f"Batch image {i} could not be decoded: {str(e)}")
+            continue
+        if len(context.pixels) < k:
+            logging.error(f"Batch image {i}: too few pixels for clustering")
+            continue
+        bin_colors, bin_counts, inverse = color_histogram(context.pixels, bits=hist_bits if engine == 'fast' else 8)
+        prepared.append((i, context, bin_colors, bin_counts, inverse))
+
+    results = [None] * len(datas)
+    if not prepared:
+        # Every image was a cache hit upstream or failed to decode
+        return results
+    thumbnails = [context.thumbnail for _, context, _, _, _ in prepared]
+    masks = [context.mask for _, context, _, _, _ in prepared]
+    features = texture_features(*prepare_stack(thumbnails, masks))
+    described = {
+        i: (pattern, embedding)
+        for (i, _, _, _, _), pattern, embedding in zip(
+            prepared, pattern_predictions(features), image_embeddings(thumbnails, masks, features)
+        )
+    }
+    # Similar sizes share a chunk, which keeps padding small
+    prepared.sort(key=lambda item: len(item[2]))
+    start_time = time.time()
+    for offset in range(0, len(prepared), BATCH_CHUNK):
+        chunk = prepared[offset:offset + BATCH_CHUNK]
+        width = max(len(item[2]) for item in chunk)
+        points = np.zeros((len(chunk), width, 3))
+        weights = np.zeros((len(chunk), width))
+        for row, (_, _, chunk_points, chunk_weights, _) in enumerate(chunk):
+            points[row, :len(chunk_points)] = chunk_points
+            weights[row, :len(chunk_weights)] = chunk_weights
+        labels, centers = batched_kmeans(points, weights, k=k)
+
+        for row, (i, context, chunk_points, _, inverse) in enumerate(chunk):
+            context.labels = labels[row, :len(chunk_points)][inverse]
+            context.centers = centers[row]
+            colors = dominant_colors_from_labels(context.labels, context.centers)
+            color_validation = validate_color_clustering(
+                context.thumbnail, colors, k=k, context=context, silhouette_mode=silhouette_mode
+            )
+            results[i] = (colors, color_validation) + described[i]
+    logging.info(f"Batch-clustered {len(prepared)}/{len(datas)} images ({engine}) in {time.time() - start_time:.2f}s")
+    return results
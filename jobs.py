@@ -0,0 +1,166 @@
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+
+class JobQueue:
+    """Background cluster-analysis jobs persisted in SQLite.
+
+    Jobs are stored in the cluster_jobs table and executed by a small pool
+    of worker threads that call run_job(job, report_progress, is_cancelled).
+    Progress counters are written back as the job runs, and jobs that were
+    queued or running when the process stopped are picked up again by start().
+    All writes go through db's writer thread; reads use its per-thread
+    read connections.
+    """
+
+    def __init__(self, run_job, db, workers=2, progress_interval=0.5):
+        self.run_job = run_job
+        self.workers = workers
+        self.progress_interval = progress_interval
+        self._db = db
+        self._queue = queue.Queue()
+        self._cancelled = set()
+        self._threads = []
+
+        def create_table(cursor):
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cluster_jobs (
+                    id TEXT PRIMARY KEY,
+                    cluster_name TEXT NOT NULL,
+                    image_urls_json TEXT NOT NULL,
+                    options_json TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    result_json TEXT,
+                    error TEXT
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cluster_jobs_status ON cluster_jobs (status, created_at)')
+        db.write(create_table).result()
+
+    @staticmethod
+    def _now():
+        return time.strftime("%Y-%m-%d %H:%M:%S")
+
+    def _execute(self, sql, params=(), wait=True):
+        """Run one statement on the writer thread; returns its rowcount, or None if wait is False."""
+        future = self._db.write(lambda cursor: cursor.execute(sql, params).rowcount)
+        return future.result() if wait else None
+
+    def start(self):
+        """Requeue unfinished jobs from a previous run and start the worker threads."""
+        self._execute("UPDATE cluster_jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (self._now(),))
+        rows = self._db.reader().execute(
+            "SELECT id FROM cluster_jobs WHERE status = 'queued' ORDER BY created_at"
+        ).fetchall()
+        for row in rows:
+            self._queue.put(row['id'])
+        if rows:
+            logging.info(f"Requeued {len(rows)} unfinished cluster jobs")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"cluster-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, cluster_name, image_urls, options=None):
+        job_id = uuid.uuid4().hex
+        now = self._now()
+        self._execute('''
+            INSERT INTO cluster_jobs (
+                id, cluster_name, image_urls_json, options_json, status, total, created_at, updated_at
+            ) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)
+        ''', (job_id, cluster_name, json.dumps(image_urls), json.dumps(options or {}), len(image_urls), now, now))
+        self._queue.put(job_id)
+        logging.info(f"Queued cluster job {job_id} ({cluster_name}, {len(image_urls)} images)")
+        return job_id
+
+    def get(self, job_id, include_urls=False):
+        """Return a job's state as a dict, or None if it does not exist."""
+        row = self._db.reader().execute('SELECT * FROM cluster_jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            'job_id': row['id'],
+            'cluster_name': row['cluster_name'],
+            'status': row['status'],
+            'progress': {'done': row['done'], 'failed': row['failed'], 'total': row['total']},
+            'options': json.loads(row['options_json']),
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+        if include_urls:
+            job['image_urls'] = json.loads(row['image_urls_json'])
+        if row['result_json']:
+            job['result'] = json.loads(row['result_json'])
+        if row['error']:
+            job['error'] = row['error']
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns its updated state, or None if unknown."""
+        updated = self._execute(
+            "UPDATE cluster_jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status = 'queued'",
+            (self._now(), job_id)
+        )
+        if updated == 0:
+            job = self.get(job_id)
+            if job and job['status'] == 'running':
+                self._cancelled.add(job_id)
+        return self.get(job_id)
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                logging.error(f"Cluster job {job_id} crashed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id):
+        claimed = self._execute(
+            "UPDATE cluster_jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+            (self._now(), job_id)
+        )
+        if claimed == 0:
+            return  # cancelled (or already taken) while waiting in the queue
+        job = self.get(job_id, include_urls=True)
+        last_update = [0.0]
+
+        def report_progress(done, failed, force=False):
+            now = time.monotonic()
+            if force or now - last_update[0] >= self.progress_interval:
+                last_update[0] = now
+                # Writes apply in queue order, so progress never lands after the final status
+                self._execute(
+                    'UPDATE cluster_jobs SET done = ?, failed = ?, updated_at = ? WHERE id = ?',
+                    (done, failed, self._now(), job_id), wait=False
+                )
+
+        def is_cancelled():
+            return job_id in self._cancelled
+
+        try:
+            result = self.run_job(job, report_progress, is_cancelled)
+            status = 'cancelled' if is_cancelled() else 'completed'
+            self._execute(
+                'UPDATE cluster_jobs SET status = ?, result_json = ?, updated_at = ? WHERE id = ?',
+                (status, json.dumps(result), self._now(), job_id)
+            )
+            logging.info(f"Cluster job {job_id} {status}")
+        except Exception as e:
+            logging.error(f"Cluster job {job_id} failed: {str(e)}")
+            self._execute(
+                "UPDATE cluster_jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                (str(e), self._now(), job_id)
+            )
+        finally:
+            self._cancelled.discard(job_id)
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+def content_digest(data):
+    """SHA-256 hex digest of an image's encoded bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+def cache_key(digest, *params):
+    """Cache key for a report: the image digest plus the analysis parameters."""
+    return ':'.join([digest] + [str(p) for p in params])
+
+class ResultCache:
+    """Two-tier cache of analysis reports keyed by image content.
+
+    Reports live in an in-memory LRU in front of a SQLite table. A second
+    table maps each URL to the ETag and content digest of its last download,
+    so a repeated URL can be confirmed with a conditional request instead of
+    a full download. Entries older than ttl seconds are treated as misses.
+
+    Reads use db's per-thread read connections. Writes are queued to db's
+    writer thread without waiting, so they share its group commits instead
+    of competing with it for the WAL write lock.
+    """
+
+    def __init__(self, db, ttl=7 * 24 * 3600, memory_entries=256, db_entries=10000):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.db_entries = db_entries
+        self._db = db
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        def create_tables(cursor):
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    report_json TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_result_cache_accessed ON result_cache (accessed_at)')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS url_cache (
+                    image_url TEXT PRIMARY KEY,
+                    etag TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_url_cache_created ON url_cache (created_at)')
+        db.write(create_tables).result()
+
+    def _expired(self, created_at):
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _write(self, what, func, *args):
+        """Queue func(cursor, *args) on the writer thread, logging rather than raising a failure."""
+        def log_failure(future):
+            if future.exception() is not None:
+                logging.error(f"{what} failed: {str(future.exception())}")
+        self._db.write(func, *args).add_done_callback(log_failure)
+
+    def get(self, key):
+        """Return (report, tier) for a cached key, or (None, None) on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, report = entry
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    return report, 'memory'
+                del self._memory[key]
+
+        try:
+            row = self._db.reader().execute(
+                'SELECT report_json, created_at FROM result_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Result cache read failed: {str(e)}")
+            return None, None
+        if row is None:
+            return None, None
+        if self._expired(row[1]):
+            self._write("Result cache delete", self._delete, key)
+            return None, None
+        # accessed_at only orders eviction, so the touch is queued and not waited for
+        self._write("Result cache touch", self._touch, key, time.time())
+        report = json.loads(row[0])
+        with self._lock:
+            self._remember(key, row[1], report)
+        return report, 'sqlite'
+
+    @staticmethod
+    def _delete(cursor, key):
+        cursor.execute('DELETE FROM result_cache WHERE cache_key = ?', (key,))
+
+    @staticmethod
+    def _touch(cursor, key, accessed_at):
+        cursor.execute('UPDATE result_cache SET accessed_at = ? WHERE cache_key = ?', (accessed_at, key))
+
+    def put(self, key, report):
+        self.put_many([(key, report)])
+
+    def put_many(self, entries):
+        """Cache (key, report) pairs with a single queued write."""
+        now = time.time()
+        with self._lock:
+            for key, report in entries:
+                self._remember(key, now, report)
+        rows = [(key, json.dumps(report), now, now) for key, report in entries]
+
+        def insert(cursor):
+            cursor.executemany('''
+                INSERT OR REPLACE INTO result_cache (cache_key, report_json, created_at, accessed_at)
+                VALUES (?, ?, ?, ?)
+            ''', rows)
+            cursor.execute('''
+                DELETE FROM result_cache WHERE cache_key IN (
+                    SELECT cache_key FROM result_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.db_entries,))
+        self._write("Result cache write", insert)
+
+    def _remember(self, key, created_at, report):
+        self._memory[key] = (created_at, report)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def lookup_url(self, image_url):
+        """Return (etag, digest) recorded for a URL, or None."""
+        try:
+            row = self._db.reader().execute(
+                'SELECT etag, digest, created_at FROM url_cache WHERE image_url = ?', (image_url,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"URL cache read failed: {str(e)}")
+            return None
+        if row is None or self._expired(row[2]):
+            return None
+        return row[0], row[1]
+
+    def remember_url(self, image_url, etag, digest):
+        if not etag:
+            return
+        row = (image_url, etag, digest, time.time())
+
+        def insert(cursor):
+            cursor.execute('''
+                INSERT OR REPLACE INTO url_cache (image_url, etag, digest, created_at)
+                VALUES (?, ?, ?, ?)
+            ''', row)
+            # Bounded like result_cache: expired rows go, then all but the newest db_entries
+            if self.ttl is not None:
+                cursor.execute('DELETE FROM url_cache WHERE created_at < ?', (row[3] - self.ttl,))
+            cursor.execute('''
+                DELETE FROM url_cache WHERE image_url IN (
+                    SELECT image_url FROM url_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.db_entries,))
+        self._write("URL cache write", insert)
@@ -0,0 +1,270 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+class SimilarityIndex:
+    """Nearest-neighbour index over unit-length image embeddings.
+
+    Vectors live in a memory-mapped float32 matrix (vectors.f32) whose rows
+    are mapped to image URLs, and the content digests they were computed
+    from, in a SQLite table. Similarity is the dot product.
+
+    Below ivf_min_rows every search is an exact scan. Above it, the rows are
+    partitioned by k-means centroids (an inverted-file index) and a search
+    only scores the rows in the nprobe partitions whose centroids are
+    nearest the query, which keeps it at a few milliseconds at a million
+    rows. The centroids are retrained in a background thread whenever the
+    index has doubled in size since they were last trained.
+    """
+
+    def __init__(self, path, dim, model, ivf_min_rows=50000, nprobe=16, train_sample=65536):
+        self.path = path
+        self.dim = dim
+        self.model = model
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self.train_sample = train_sample
+        self._lock = threading.Lock()
+        self._training = None
+        os.makedirs(path, exist_ok=True)
+
+        self._conn = sqlite3.connect(os.path.join(path, 'ids.db'), check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embedding_ids (
+                row INTEGER PRIMARY KEY,
+                image_url TEXT NOT NULL UNIQUE,
+                digest TEXT,
+                added_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS index_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        meta = dict(self._conn.execute('SELECT key, value FROM index_meta'))
+        if meta and (meta.get('model') != model or int(meta.get('dim', 0)) != dim):
+            logging.warning(f"Similarity index at {path} holds {meta.get('model')} vectors; rebuilding for {model}")
+            self._conn.execute('DELETE FROM embedding_ids')
+            self._conn.execute('DELETE FROM index_meta')
+            for name in ('vectors.f32', 'lists.i32', 'centroids.npy'):
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+            meta = {}
+        self._conn.executemany('INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)', [
+            ('model', model), ('dim', str(dim))
+        ])
+        self._conn.commit()
+        self._trained_rows = int(meta.get('trained_rows', 0))
+
+        self._row_urls = []
+        self._url_rows = {}
+        self._digest_rows = {}
+        for row, image_url, digest in self._conn.execute('SELECT row, image_url, digest FROM embedding_ids ORDER BY row'):
+            self._row_urls.append(image_url)
+            self._url_rows[image_url] = row
+            if digest:
+                self._digest_rows[digest] = row
+        if self._row_urls and self._url_rows[self._row_urls[-1]] != len(self._row_urls) - 1:
+            raise RuntimeError(f"Similarity index at {path} has gaps in its row numbers")
+
+        self._capacity = 0
+        self._vectors = None
+        self._assignments = None  # partition + 1 per row, 0 while unassigned
+        self._ensure_capacity(len(self._row_urls))
+
+        self._centroids = None
+        centroids_path = os.path.join(path, 'centroids.npy')
+        if os.path.exists(centroids_path):
+            self._centroids = np.load(centroids_path)
+            self._assign_unassigned()
+            self._build_lists()
+        logging.info(f"Similarity index loaded: {len(self)} vectors ({model})")
+
+    def __len__(self):
+        return len(self._row_urls)
+
+    def __contains__(self, image_url):
+        return image_url in self._url_rows
+
+    def _ensure_capacity(self, rows):
+        """Grow the vector and assignment files (by doubling) to hold at least rows rows."""
+        if rows <= self._capacity and self._vectors is not None:
+            return
+        capacity = max(rows, self._capacity * 2, 1024)
+        for name, dtype, width in (('vectors.f32', np.float32, self.dim), ('lists.i32', np.int32, 1)):
+            file_path = os.path.join(self.path, name)
+            with open(file_path, 'ab') as f:
+                size = f.tell()
+                needed = capacity * width * np.dtype(dtype).itemsize
+                if size < needed:
+                    f.truncate(needed)
+                else:
+                    capacity = max(capacity, size // (width * np.dtype(dtype).itemsize))
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._assignments.flush()
+        self._vectors = np.memmap(os.path.join(self.path, 'vectors.f32'), dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+        self._assignments = np.memmap(os.path.join(self.path, 'lists.i32'), dtype=np.int32, mode='r+', shape=(capacity,))
+        self._capacity = capacity
+
+    def _nearest_centroids(self, vectors, centroids, chunk=16384):
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk):
+            assignments[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+        return assignments
+
+    def _assign_unassigned(self):
+        n = len(self)
+        missing = np.flatnonzero(self._assignments[:n] == 0)
+        if len(missing):
+            self._assignments[missing] = self._nearest_centroids(self._vectors[missing], self._centroids) + 1
+
+    def _build_lists(self):
+        """Group rows by partition: rows of partition p are _order[_offsets[p]:_offsets[p + 1]]."""
+        partitions = np.asarray(self._assignments[:len(self)]) - 1
+        self._order = np.argsort(partitions, kind='stable').astype(np.int64)
+        self._offsets = np.searchsorted(partitions[self._order], np.arange(len(self._centroids) + 1))
+        self._extra = {}
+
+    def add(self, image_url, digest, vector):
+        self.add_many([(image_url, digest, vector)])
+
+    def add_many(self, entries):
+        """Insert or replace (image_url, digest, vector) entries."""
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            rows = []
+            for image_url, digest, _ in entries:
+                row = self._url_rows.get(image_url)
+                if row is None:
+                    row = len(self._row_urls)
+                    self._row_urls.append(image_url)
+                    self._url_rows[image_url] = row
+                rows.append(row)
+                if digest:
+                    self._digest_rows[digest] = row
+            self._ensure_capacity(len(self._row_urls))
+            rows = np.array(rows, dtype=np.int64)
+            vectors = np.array([vector for _, _, vector in entries], dtype=np.float32).reshape(len(entries), self.dim)
+            self._vectors[rows] = vectors
+            if self._centroids is not None:
+                partitions = self._nearest_centroids(vectors, self._centroids)
+                self._assignments[rows] = partitions + 1
+                for row, partition in zip(rows.tolist(), partitions.tolist()):
+                    self._extra.setdefault(partition, []).append(row)
+            if self._training is not None:
+                self._training['changed'].update(rows.tolist())
+            self._vectors.flush()
+            self._assignments.flush()
+            self._conn.executemany('''
+                INSERT OR REPLACE INTO embedding_ids (row, image_url, digest, added_at) VALUES (?, ?, ?, ?)
+            ''', [(int(row), image_url, digest, now) for row, (image_url, digest, _) in zip(rows, entries)])
+            self._conn.commit()
+
+            n = len(self)
+            if self._training is None and n >= self.ivf_min_rows and n >= 2 * self._trained_rows:
+                self._training = {'changed': set()}
+                threading.Thread(target=self._train, name='similarity-train', daemon=True).start()
+
+    def alias(self, image_url, digest):
+        """Index image_url with the vector already stored for the same content digest.
+
+        Returns whether image_url is now indexed.
+        """
+        with self._lock:
+            if image_url in self._url_rows:
+                return True
+            row = self._digest_rows.get(digest) if digest else None
+            if row is None:
+                return False
+            vector = np.array(self._vectors[row])
+        self.add(image_url, digest, vector)
+        return True
+
+    def vector(self, image_url):
+        with self._lock:
+            row = self._url_rows.get(image_url)
+            return None if row is None else np.array(self._vectors[row])
+
+    def search(self, vector, k=10, exclude=None, nprobe=None):
+        """Return up to k (image_url, similarity) pairs, most similar first.
+
+        exclude is an image URL left out of the results (usually the query's own).
+        """
+        query = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        nprobe = nprobe or self.nprobe
+        with self._lock:
+            n = len(self)
+            if self._centroids is not None and n >= self.ivf_min_rows:
+                centroid_scores = self._centroids @ query
+                probe = np.argsort(-centroid_scores)[:nprobe]
+                parts = [self._order[self._offsets[p]:self._offsets[p + 1]] for p in probe]
+                parts += [np.array(self._extra[p], dtype=np.int64) for p in probe if p in self._extra]
+                candidates = np.unique(np.concatenate(parts))
+                # A row re-added since the lists were built may also sit in its old partition
+                candidates = candidates[np.isin(self._assignments[candidates] - 1, probe)]
+                scores = self._vectors[candidates] @ query
+            else:
+                candidates = np.arange(n)
+                scores = self._vectors[:n] @ query
+            excluded = self._url_rows.get(exclude)
+            if excluded is not None:
+                keep = candidates != excluded
+                candidates, scores = candidates[keep], scores[keep]
+            top = min(k, len(candidates))
+            if top <= 0:
+                return []
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+            return [(self._row_urls[candidates[i]], float(scores[i])) for i in best]
+
+    def _train(self):
+        """Retrain the partition centroids with spherical k-means, then reassign every row."""
+        try:
+            start_time = time.time()
+            with self._lock:
+                n = len(self)
+                vectors = self._vectors
+                sample_rows = np.sort(np.random.default_rng(n).choice(n, size=min(n, self.train_sample), replace=False))
+                sample = np.array(vectors[sample_rows])
+            n_lists = int(min(4096, max(16, np.sqrt(n))))
+            rng = np.random.default_rng(0)
+            centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+            for _ in range(10):
+                labels = self._nearest_centroids(sample, centroids)
+                sums = np.stack([
+                    np.bincount(labels, weights=sample[:, d], minlength=n_lists) for d in range(self.dim)
+                ], axis=1)
+                empty = np.flatnonzero(np.bincount(labels, minlength=n_lists) == 0)
+                sums[empty] = sample[rng.choice(len(sample), size=len(empty))]
+                centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+            centroids = centroids.astype(np.float32)
+
+            # The expensive full reassignment runs without the lock; rows written meanwhile are redone below
+            assignments = np.empty(n, dtype=np.int32)
+            for start in range(0, n, 65536):
+                assignments[start:start + 65536] = self._nearest_centroids(vectors[start:min(n, start + 65536)], centroids)
+
+            with self._lock:
+                self._assignments[:n] = assignments + 1
+                redo = np.array(sorted(set(self._training['changed']) | set(range(n, len(self)))), dtype=np.int64)
+                if len(redo):
+                    self._assignments[redo] = self._nearest_centroids(self._vectors[redo], centroids) + 1
+                self._assignments.flush()
+                centroids_path = os.path.join(self.path, 'centroids.npy')
+                np.save(centroids_path + '.tmp.npy', centroids)
+                os.replace(centroids_path + '.tmp.npy', centroids_path)
+                self._centroids = centroids
+                self._build_lists()
+                self._trained_rows = n
+                self._conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('trained_rows', ?)", (str(n),))
+                self._conn.commit()
+            logging.info(f"Similarity index trained {n_lists} partitions over {n} vectors in {time.time() - start_time:.1f}s")
+        except Exception as e:
+            logging.error(f"Similarity index training failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._training = None
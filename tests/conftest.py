@@ -0,0 +1,24 @@
+import importlib
+import os
+
+import pytest
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    # app.py opens fashion_analysis.db and its caches in the working directory at import
+    workdir = tmp_path_factory.mktemp('app')
+    previous = os.getcwd()
+    saved_env = dict(os.environ)
+    os.environ.update({
+        'FASHION_IMAGE_CACHE_DIR': str(workdir / 'image_cache'),
+        'FASHION_SIMILARITY_DIR': '',
+        'FASHION_ANALYSIS_WORKERS': '1',
+        'FASHION_JOB_WORKERS': '1'
+    })
+    os.chdir(workdir)
+    try:
+        yield importlib.import_module('app')
+    finally:
+        os.chdir(previous)
+        os.environ.clear()
+        os.environ.update(saved_env)
@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+
+import pytest
+
+from database import Database
+
+@pytest.fixture
+def db(tmp_path):
+    # A long flush interval keeps every write queued below in one batch
+    db = Database(str(tmp_path / 'test.db'), flush_interval=0.5)
+    db.write(lambda cursor: cursor.execute('CREATE TABLE items (name TEXT UNIQUE)')).result()
+    yield db
+    db.close()
+
+def insert(cursor, name):
+    cursor.execute('INSERT INTO items (name) VALUES (?)', (name,))
+    return cursor.lastrowid
+
+def names(db):
+    return sorted(row['name'] for row in db.reader().execute('SELECT name FROM items'))
+
+def test_failed_write_rolls_back_alone(db):
+    def insert_then_fail(cursor):
+        insert(cursor, 'partial')
+        raise ValueError("boom")
+
+    futures = [
+        db.write(insert, 'a'),
+        db.write(insert, 'a'),  # violates UNIQUE
+        db.write(insert_then_fail),
+        db.write(insert, 'b')
+    ]
+    db.flush()
+
+    assert futures[0].result() and futures[3].result()
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result()
+    with pytest.raises(ValueError):
+        futures[2].result()
+    assert names(db) == ['a', 'b']
+
+def test_flush_waits_for_every_queued_write(tmp_path):
+    db = Database(str(tmp_path / 'test.db'), batch_size=3, flush_interval=0.01)
+    db.write(lambda cursor: cursor.execute('CREATE TABLE items (name TEXT UNIQUE)'))
+    futures = [db.write(insert, f'item{i}') for i in range(10)]
+    db.flush()
+    assert all(future.done() for future in futures)
+    assert len(names(db)) == 10
+    # Every queued item was marked done, so flushing an idle writer returns at once
+    assert db._queue.unfinished_tasks == 0
+    db.flush()
+    db.close()
+
+def test_flush_from_several_threads(db):
+    threads = [threading.Thread(target=lambda i=i: (db.write(insert, f'item{i}'), db.flush())) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(names(db)) == 8
+
+def test_write_after_close_fails(tmp_path):
+    db = Database(str(tmp_path / 'test.db'))
+    db.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.write(insert, 'late').result()
+    db.close()
@@ -0,0 +1,142 @@
+import json
+import sqlite3
+
+import pytest
+
+@pytest.fixture
+def db(app, tmp_path):
+    db = app.initialize_database(str(tmp_path / 'history.db'))
+    yield db
+    db.close()
+
+def make_report(image_url, timestamp, colors, pattern='floral', style='casual'):
+    return {
+        'image_url': image_url,
+        'timestamp': timestamp,
+        'colors': [
+            {'color': list(rgb), 'percentage': percentage, 'hex': '#%02x%02x%02x' % rgb}
+            for rgb, percentage in colors
+        ],
+        'predictions': {
+            'pattern': {'predicted': pattern, 'confidence': 0.8},
+            'style': {'predicted': style, 'confidence': 0.75}
+        },
+        'validation': {'colors': {'status': 'PASS'}, 'pattern_style': {'status': 'PASS'}}
+    }
+
+RED, NAVY, WHITE = (255, 0, 0), (0, 0, 128), (255, 255, 255)
+
+REPORTS = [
+    make_report('http://a/1', '2024-03-01 09:00:00', [(RED, 60.0), (WHITE, 40.0)]),
+    make_report('http://a/2', '2024-03-01 09:00:00', [(NAVY, 100.0)], pattern='striped'),
+    make_report('http://a/1', '2024-03-02 12:30:00', [(RED, 30.0), (NAVY, 70.0)], style='formal'),
+    make_report('http://a/3', '2024-03-02 12:30:00', [(WHITE, 100.0)]),
+    make_report('http://a/1', '2024-03-03 08:15:00', [(RED, 100.0)], pattern='striped')
+]
+
+def store_all(app, db, reports):
+    futures = [app.store_analysis_report(db, report) for report in reports]
+    return [future.result() for future in futures]
+
+def all_rows(db, sql):
+    return sorted(tuple(row) for row in db.reader().execute(sql))
+
+def test_migration_backfills_rows_written_as_json_only(app, db, tmp_path):
+    ids = store_all(app, db, REPORTS)
+    db.flush()
+    expected_colors = all_rows(db, 'SELECT analysis_id, hex, r, g, b, name, percentage FROM analysis_colors')
+    expected_predictions = all_rows(db, 'SELECT analysis_id, kind, label, confidence FROM analysis_predictions')
+    expected_trends = all_rows(db, 'SELECT * FROM trend_daily_colors')
+
+    # Rewind to a database written before the normalized tables existed
+    raw = sqlite3.connect(str(tmp_path / 'history.db'))
+    for table in ('analysis_colors', 'analysis_predictions', 'trend_daily_colors', 'trend_daily_predictions'):
+        raw.execute(f'DELETE FROM {table}')
+    raw.execute('PRAGMA user_version = 0')
+    raw.commit()
+    app.migrate_database(raw)
+    assert raw.execute('PRAGMA user_version').fetchone()[0] == 2
+    raw.close()
+
+    assert all_rows(db, 'SELECT analysis_id, hex, r, g, b, name, percentage FROM analysis_colors') == expected_colors
+    assert all_rows(db, 'SELECT analysis_id, kind, label, confidence FROM analysis_predictions') == expected_predictions
+    assert all_rows(db, 'SELECT * FROM trend_daily_colors') == expected_trends
+    assert {row[0] for row in expected_colors} == set(ids)
+
+def test_migration_resumes_a_partial_backfill(app, db, tmp_path):
+    store_all(app, db, REPORTS)
+    db.flush()
+    expected = all_rows(db, 'SELECT analysis_id, hex, name FROM analysis_colors')
+
+    # A backfill interrupted after the first analyses keeps their rows
+    raw = sqlite3.connect(str(tmp_path / 'history.db'))
+    raw.execute('DELETE FROM analysis_colors WHERE analysis_id > 2')
+    raw.execute('DELETE FROM analysis_predictions WHERE analysis_id > 2')
+    raw.execute('PRAGMA user_version = 0')
+    raw.commit()
+    app.migrate_database(raw)
+    raw.close()
+    assert all_rows(db, 'SELECT analysis_id, hex, name FROM analysis_colors') == expected
+
+def test_incremental_rollups_match_a_full_rebuild(app, db, tmp_path):
+    store_all(app, db, REPORTS)
+    db.flush()
+    incremental = app.query_trends(db, '2024-03-01', '2024-03-03', series=True)
+
+    raw = sqlite3.connect(str(tmp_path / 'history.db'))
+    raw.execute('PRAGMA user_version = 1')
+    raw.commit()
+    app.migrate_database(raw)
+    raw.close()
+    rebuilt = app.query_trends(db, '2024-03-01', '2024-03-03', series=True)
+    assert json.dumps(incremental, sort_keys=True) == json.dumps(rebuilt, sort_keys=True)
+
+    colors = {c['name']: c for c in incremental['colors']}
+    assert colors['red']['count'] == 3
+    assert colors['red']['total_percentage'] == pytest.approx(190.0)
+    assert colors['red']['avg_percentage'] == pytest.approx(190.0 / 3)
+    assert {p['label']: p['count'] for p in incremental['patterns']} == {'floral': 3, 'striped': 2}
+    assert [day['day'] for day in incremental['series']] == ['2024-03-01', '2024-03-02', '2024-03-03']
+
+def test_trends_respect_the_day_range(app, db):
+    store_all(app, db, REPORTS)
+    db.flush()
+    trends = app.query_trends(db, '2024-03-02', '2024-03-02')
+    assert {c['name']: c['count'] for c in trends['colors']} == {'red': 1, 'navy': 1, 'white': 1}
+    assert {s['label']: s['count'] for s in trends['styles']} == {'formal': 1, 'casual': 1}
+
+def page_through(app, db, limit, **filters):
+    seen, cursor = [], None
+    while True:
+        page = app.page_history(db, 'analysis_results', cursor=cursor, limit=limit, include_json=False, **filters)
+        assert len(page['items']) <= limit
+        seen.extend((item['timestamp'], item['id']) for item in page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return seen
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 10])
+def test_keyset_pages_cover_every_row_once(app, db, limit):
+    store_all(app, db, REPORTS)
+    db.flush()
+    expected = sorted(((r['timestamp'], i) for i, r in enumerate(REPORTS, start=1)), reverse=True)
+    # Rows sharing a timestamp are ordered by id, so ties never repeat or skip across pages
+    assert page_through(app, db, limit) == expected
+
+def test_keyset_pages_with_filters(app, db):
+    store_all(app, db, REPORTS)
+    db.flush()
+    assert page_through(app, db, 1, key='http://a/1') == [
+        ('2024-03-03 08:15:00', 5), ('2024-03-02 12:30:00', 3), ('2024-03-01 09:00:00', 1)
+    ]
+    # A bare end date covers that whole day
+    assert page_through(app, db, 2, start='2024-03-02', end='2024-03-02') == [
+        ('2024-03-02 12:30:00', 4), ('2024-03-02 12:30:00', 3)
+    ]
+
+def test_cursor_round_trip_and_rejection(app):
+    cursor = app.encode_cursor('2024-03-02 12:30:00', 4)
+    assert app.decode_cursor(cursor) == ('2024-03-02 12:30:00', 4)
+    for bad in ('not-a-cursor', app.encode_cursor('2024-03-02', 'x')):
+        with pytest.raises(ValueError):
+            app.decode_cursor(bad)
@@ -0,0 +1,105 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_cache import DiskImageCache, create_session
+
+class ImageServer(ThreadingHTTPServer):
+    """Serves /<name> as a fixed body with an ETag, answering If-None-Match with a 304."""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ImageHandler)
+        self.bodies = {}
+        self.no_store = set()
+        self.requests = []
+
+    def url(self, name):
+        return f'http://127.0.0.1:{self.server_address[1]}/{name}'
+
+class ImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        name = self.path.lstrip('/')
+        body = self.server.bodies[name]
+        etag = f'"{name}-{len(body)}"'
+        conditional = self.headers.get('If-None-Match')
+        self.server.requests.append((name, conditional))
+        if conditional == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        if name in self.server.no_store:
+            self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ImageServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def fetch(app, tmp_path, monkeypatch):
+    """app.fetch_image_bytes against a fresh 250-byte disk cache."""
+    cache = DiskImageCache(str(tmp_path / 'image_cache'), max_bytes=250)
+    monkeypatch.setattr(app, 'image_cache', cache)
+    monkeypatch.setattr(app, 'http_session', create_session(pool_size=2))
+
+    def fetch(url, etag=None):
+        return app.fetch_image_bytes(url, etag=etag)
+    fetch.cache = cache
+    return fetch
+
+def test_not_modified_is_served_from_disk(server, fetch):
+    server.bodies['a'] = b'a' * 100
+    url = server.url('a')
+    assert fetch(url) == (b'a' * 100, '"a-100"')
+    assert fetch(url) == (b'a' * 100, '"a-100"')
+    assert server.requests == [('a', None), ('a', '"a-100"')]
+
+def test_not_modified_without_a_disk_copy_returns_the_callers_etag(server, fetch):
+    server.bodies['a'] = b'a' * 100
+    # The result cache already knows this ETag, so no body is needed
+    assert fetch(server.url('a'), etag='"a-100"') == (None, '"a-100"')
+
+def test_least_recently_used_bodies_are_evicted_by_size(server, fetch):
+    for name in 'abc':
+        server.bodies[name] = name.encode() * 100
+    fetch(server.url('a'))
+    fetch(server.url('b'))
+    fetch(server.url('a'))  # 304 from disk; a becomes the most recently used
+    fetch(server.url('c'))  # 300 bytes over a 250-byte budget evicts b
+    assert fetch.cache.read(server.url('b')) is None
+    assert fetch.cache.read(server.url('a')) == b'a' * 100
+    assert fetch.cache.read(server.url('c')) == b'c' * 100
+
+    reopened = DiskImageCache(fetch.cache.cache_dir, max_bytes=250)
+    assert reopened._total_bytes == 200
+    server.requests.clear()
+    fetch(server.url('b'))
+    assert server.requests == [('b', None)]
+
+def test_bodies_larger_than_the_cache_are_not_stored(server, fetch):
+    server.bodies['big'] = b'x' * 300
+    fetch(server.url('big'))
+    fetch(server.url('big'))
+    assert server.requests == [('big', None), ('big', None)]
+
+def test_no_store_responses_are_not_cached(server, fetch):
+    server.bodies['private'] = b'p' * 50
+    server.no_store.add('private')
+    assert fetch(server.url('private')) == (b'p' * 50, '"private-50"')
+    assert fetch.cache.read(server.url('private')) is None
+    fetch(server.url('private'))
+    assert server.requests == [('private', None), ('private', None)]
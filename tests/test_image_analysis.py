@@ -0,0 +1,29 @@
+import cv2
+import numpy as np
+
+from backend.embedding import EMBEDDING_DIM, image_embeddings
+from backend.texture import FEATURE_NAMES, prepare_stack, texture_features, pattern_predictions
+from image_analysis import analyze_image_batch
+
+def test_texture_features_of_an_empty_stack():
+    features = texture_features(*prepare_stack([], []))
+    assert features.shape == (0, len(FEATURE_NAMES))
+    assert pattern_predictions(features) == []
+    assert image_embeddings([], [], features).shape == (0, EMBEDDING_DIM)
+
+def test_batch_with_nothing_to_analyze():
+    # /api/analyze-batch passes an empty list when every image was a cache hit
+    assert analyze_image_batch([]) == []
+
+def test_batch_where_every_image_fails_to_decode():
+    assert analyze_image_batch([b'', b'not an image']) == [None, None]
+
+def test_batch_analyzes_decodable_images_around_failures():
+    image = np.zeros((64, 64, 3), np.uint8)
+    image[:, ::8] = (200, 40, 40)
+    data = cv2.imencode('.png', image)[1].tobytes()
+    results = analyze_image_batch([b'not an image', data])
+    assert results[0] is None
+    colors, color_validation, pattern, embedding = results[1]
+    assert colors and pattern['predicted']
+    assert embedding.shape == (EMBEDDING_DIM,)
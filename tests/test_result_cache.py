@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+from database import Database
+from result_cache import ResultCache
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'cache.db'))
+    yield db
+    db.close()
+
+def url_rows(db):
+    return sorted(row['image_url'] for row in db.reader().execute('SELECT image_url FROM url_cache'))
+
+def test_url_cache_keeps_the_newest_db_entries(db):
+    cache = ResultCache(db, db_entries=2)
+    for name in 'abc':
+        cache.remember_url(f'http://x/{name}', f'"{name}"', name * 64)
+        time.sleep(0.01)
+    db.flush()
+    assert url_rows(db) == ['http://x/b', 'http://x/c']
+    assert cache.lookup_url('http://x/a') is None
+    assert cache.lookup_url('http://x/c') == ('"c"', 'c' * 64)
+
+def test_url_cache_drops_expired_rows(db):
+    cache = ResultCache(db, ttl=60)
+    db.write(lambda cursor: cursor.execute(
+        'INSERT INTO url_cache (image_url, etag, digest, created_at) VALUES (?, ?, ?, ?)',
+        ('http://x/old', '"old"', 'o' * 64, time.time() - 120)
+    ))
+    cache.remember_url('http://x/new', '"new"', 'n' * 64)
+    db.flush()
+    assert url_rows(db) == ['http://x/new']
@@ -0,0 +1,43 @@
+from io import BytesIO
+
+import cv2
+import numpy as np
+
+from image_analysis import image_format
+
+def png_bytes():
+    image = np.zeros((32, 32, 3), np.uint8)
+    image[:, ::4] = (40, 40, 200)
+    return cv2.imencode('.png', image)[1].tobytes()
+
+def test_image_format():
+    assert image_format(png_bytes()) == 'PNG'
+    assert image_format(b'garbage') is None
+    assert image_format(png_bytes()[:16]) is None
+
+def test_upload_that_is_not_an_image(app):
+    client = app.app.test_client()
+    response = client.post('/api/analyze-upload', data=b'garbage', content_type='application/octet-stream')
+    assert response.status_code == 415
+    assert response.get_json() == {'status': 'FAIL', 'error': app.NOT_AN_IMAGE}
+
+    response = client.post('/api/analyze-upload', data={'image': (BytesIO(b'garbage'), 'a.jpg')})
+    assert response.status_code == 415
+
+def test_batch_where_no_upload_is_an_image(app):
+    client = app.app.test_client()
+    response = client.post('/api/analyze-batch', data={
+        'images': [(BytesIO(b'garbage'), 'a.jpg'), (BytesIO(b'more garbage'), 'b.jpg')]
+    })
+    assert response.status_code == 415
+
+def test_batch_reports_which_uploads_are_not_images(app):
+    client = app.app.test_client()
+    response = client.post('/api/analyze-batch', data={
+        'images': [(BytesIO(b'garbage'), 'a.jpg'), (BytesIO(png_bytes()), 'b.png')]
+    })
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['status'] == 'PARTIAL'
+    assert body['results'][0] == {'image_url': 'a.jpg', 'status': 'FAIL', 'error': app.NOT_AN_IMAGE}
+    assert body['results'][1]['colors']